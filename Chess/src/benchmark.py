@@ -0,0 +1,203 @@
+"""
+This module times the engine's move generation and evaluation over a fixed set of positions.
+"""
+
+"""
+Every operation is run many times on every position of the corpus below, and the fastest of several repeats is kept,
+since slower repeats only measure other programs competing for the CPU. The garbage collector is switched off while
+timing, like the timeit module does. Results are reported in nanoseconds per operation for each game phase.
+
+Python can't count allocations directly, so two proxies are reported next to the time:
+- bytes/op: the peak memory tracemalloc sees above the starting point while one operation runs (its working memory)
+- blocks/op: the memory blocks (sys.getallocatedblocks) still alive after one operation, the returned lists included
+
+Results can be saved as a baseline JSON file and later runs compared against it, so a change to chess_engine.py or
+chess_pieces.py can be judged by numbers instead of by feel. Compare runs made on the same machine only.
+
+Usage (from the repository root):
+    python Chess/src/benchmark.py
+    python Chess/src/benchmark.py --save baseline.json
+    python Chess/src/benchmark.py --compare baseline.json --threshold 10
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from chess_engine import ChessEngine
+from chess_pieces import Piece
+from chess_ai import ChessAI
+
+#the positions are given in FEN (see ChessEngine.from_fen)
+CORPUS = {
+    "opening": [
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "r1bqk2r/1pppbppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 w kq - 4 6", #Ruy Lopez
+        "rnbqkb1r/1p2pppp/p2p1n2/8/3NP3/2N5/PPP2PPP/R1BQKB1R w KQkq - 0 6", #Sicilian Najdorf
+        "rnbq1rk1/ppp1bppp/4pn2/3p2B1/2PP4/2N1P3/PP3PPP/R2QKBNR w KQ - 1 6", #Queen's Gambit Declined
+        ],
+    "middlegame": [
+        "r4rk1/1pp3p1/2nppnqp/p1b1p3/P3P3/2PP1NN1/1P3PPP/R1BQR1K1 w - - 4 13",
+        "r2qnrk1/3nbppp/p2pb3/4p1P1/1p2P3/1N2BP2/PPPQN2P/2KR1B1R w - - 2 14",
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", #Kiwipete
+        ],
+    "endgame": [
+        "8/R7/4p3/6p1/2b1k3/B7/7P/2K5 b - - 0 30",
+        "3k4/8/8/4PR2/1P6/4K2P/1p6/2B5 w - - 0 26",
+        "8/3k4/8/8/4p3/1P2P3/8/5KN1 b - - 0 34",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        ],
+    }
+
+class Benchmark:
+    def __init__(self, number = 100, repeat = 5):
+        self.number = number #calls per timing
+        self.repeat = repeat #timings per position, the fastest one is kept
+        self.chess_piece = Piece()
+        self.chess_ai = ChessAI()
+        #every operation returns a function that runs it once on an engine, and the number of operations in one run
+        self.operations = {
+            "getAllPossibleMoves": self.allPossibleMoves,
+            "getValidMoves": self.validMoves,
+            "squareAttacked": self.squareAttacked,
+            "makeMove/undo_move": self.makeUndo,
+            "scoreMaterial": self.scoreMaterial
+            }
+
+    def allPossibleMoves(self, engine):
+        return (lambda: engine.getAllPossibleMoves(self.chess_piece, engine)), 1
+
+    def validMoves(self, engine):
+        return (lambda: engine.getValidMoves(self.chess_piece, engine)), 1
+
+    def squareAttacked(self, engine): #one run asks about all 64 squares
+        def run():
+            for row in range(8):
+                for col in range(8):
+                    engine.squareAttacked(row, col, self.chess_piece, engine)
+        return run, 64
+
+    def makeUndo(self, engine): #one run makes and undoes every legal move once
+        moves = engine.getValidMoves(self.chess_piece, engine)
+        def run():
+            for move in moves:
+                engine.makeMove(move)
+                engine.undo_move()
+        return run, len(moves)
+
+    def scoreMaterial(self, engine):
+        return (lambda: self.chess_ai.scoreMaterial(engine)), 1
+
+    def loadCorpus(self): #an engine for every position of the corpus, by phase
+        return {phase: [ChessEngine.from_fen(fen) for fen in fens] for (phase, fens) in CORPUS.items()}
+
+    def timeRun(self, run, operations): #nanoseconds per operation of the fastest repeat
+        best = None
+        gcEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            for i in range(self.repeat):
+                start = time.perf_counter_ns()
+                for j in range(self.number):
+                    run()
+                elapsed = time.perf_counter_ns() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+        finally:
+            if gcEnabled:
+                gc.enable()
+        return best / (self.number * operations)
+
+    def measureMemory(self, run, operations): #(peak bytes, blocks left alive) per operation, over one run
+        run() #warm up, so caches filled on the first call aren't counted
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        startBytes = tracemalloc.get_traced_memory()[0]
+        startBlocks = sys.getallocatedblocks()
+        result = run() #kept alive until the blocks are counted
+        blocks = sys.getallocatedblocks() - startBlocks
+        peakBytes = tracemalloc.get_traced_memory()[1] - startBytes
+        tracemalloc.stop()
+        del result
+        return peakBytes / operations, max(blocks, 0) / operations
+
+    def run(self): #results by operation and phase: {"nsPerOp", "bytesPerOp", "blocksPerOp"}
+        engines = self.loadCorpus()
+        results = {}
+        for (name, prepare) in self.operations.items():
+            results[name] = {}
+            for (phase, phaseEngines) in engines.items():
+                totalNs, totalBytes, totalBlocks = 0.0, 0.0, 0.0
+                for engine in phaseEngines:
+                    run, operations = prepare(engine)
+                    totalNs += self.timeRun(run, operations)
+                    (peakBytes, aliveBlocks) = self.measureMemory(run, operations)
+                    totalBytes += peakBytes
+                    totalBlocks += aliveBlocks
+                count = len(phaseEngines) #average over the positions of the phase
+                results[name][phase] = {"nsPerOp": totalNs / count, "bytesPerOp": totalBytes / count,
+                                        "blocksPerOp": totalBlocks / count}
+        return results
+
+def printResults(results):
+    phases = list(CORPUS)
+    print("%-22s" % "ns/op" + "".join("%14s" % phase for phase in phases))
+    for (name, byPhase) in results.items():
+        print("%-22s" % name + "".join("%14.0f" % byPhase[phase]["nsPerOp"] for phase in phases))
+    print()
+    print("%-22s" % "bytes/op, blocks/op" + "".join("%14s" % phase for phase in phases))
+    for (name, byPhase) in results.items():
+        print("%-22s" % name + "".join("%14s" % ("%.0f, %.1f" % (byPhase[phase]["bytesPerOp"], byPhase[phase]["blocksPerOp"]))
+                                       for phase in phases))
+
+def compareResults(results, baseline, threshold): #print the change in ns/op against a baseline, return the regressions
+    regressions = []
+    print()
+    print("%-22s" % "change vs baseline" + "".join("%14s" % phase for phase in CORPUS))
+    for (name, byPhase) in results.items():
+        changes = []
+        for phase in CORPUS:
+            old = baseline.get(name, {}).get(phase)
+            if old is None or old["nsPerOp"] == 0: #operation or phase not in the baseline
+                changes.append("%14s" % "-")
+                continue
+            change = 100 * (byPhase[phase]["nsPerOp"] - old["nsPerOp"]) / old["nsPerOp"]
+            changes.append("%13.1f%%" % change)
+            if change > threshold:
+                regressions.append("%s (%s): %+.1f%%" % (name, phase, change))
+        print("%-22s" % name + "".join(changes))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = "Time move generation and evaluation over a fixed position corpus.")
+    parser.add_argument("--number", type = int, default = 100, help = "calls per timing (default 100)")
+    parser.add_argument("--repeat", type = int, default = 5, help = "timings per position, the fastest is kept (default 5)")
+    parser.add_argument("--save", metavar = "FILE", help = "save the results as a baseline JSON file")
+    parser.add_argument("--compare", metavar = "FILE", help = "compare the results against a saved baseline")
+    parser.add_argument("--threshold", type = float, default = 10.0,
+                        help = "percentage slowdown counted as a regression when comparing (default 10)")
+    args = parser.parse_args()
+
+    results = Benchmark(args.number, args.repeat).run()
+    printResults(results)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"python": platform.python_version(), "results": results}, file, indent = 2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compareResults(results, baseline["results"], args.threshold)
+        if regressions:
+            print()
+            print("Slower than the baseline by more than %.0f%%:" % args.threshold)
+            for regression in regressions:
+                print("    " + regression)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
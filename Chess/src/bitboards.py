@@ -0,0 +1,152 @@
+"""
+This module stores the bitboard helpers used by the chess engine.
+"""
+
+"""
+A bitboard is a 64-bit integer in which every bit stands for one square of the board.
+Square 0 is the upper left corner of the board (row 0, col 0) and square 63 is the lower right corner (row 7, col 7),
+so the index of a square is simply row * 8 + col. This matches the (row, col) layout of ChessEngine.board.
+"""
+
+FULL_BOARD = (1 << 64) - 1 #every square set
+
+#the twelve piece codes, in the same format as the squares of ChessEngine.board
+PIECES = ("wP", "wN", "wB", "wR", "wQ", "wK",
+          "bP", "bN", "bB", "bR", "bQ", "bK")
+#the pieces of each color, in the order pawn, knight, bishop, rook, queen, king. 
+#looking codes up here avoids building a new string like color + "N" every time we need a bitboard
+COLOR_PIECES = {"w": PIECES[:6], "b": PIECES[6:]}
+OPPONENT = {"w": "b", "b": "w"}
+
+"""
+Attack tables for the pieces that jump: knights, kings and pawns. They only depend on the square a piece stands on,
+so they are built once when this module is imported. For every square we store the attack mask (a bitboard) and
+the list of target squares, so move generators don't have to repeat the offset and bounds checks on every call.
+"""
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+PAWN_CAPTURE_OFFSETS = {"w": ((-1, -1), (-1, 1)), "b": ((1, -1), (1, 1))} #white pawns move up, black pawns move down
+
+def buildTargets(offsets): #target squares of a jumping piece, for all 64 squares
+    targets = []
+    for row in range(8):
+        for col in range(8):
+            targets.append([(row + r) * 8 + col + c for (r, c) in offsets if 0 <= row + r < 8 and 0 <= col + c < 8])
+    return targets
+
+def buildMasks(targets): #turn lists of target squares into attack masks
+    return [sum(1 << square for square in squares) for squares in targets]
+
+KNIGHT_TARGETS = buildTargets(KNIGHT_OFFSETS)
+KNIGHT_ATTACKS = buildMasks(KNIGHT_TARGETS)
+KING_TARGETS = buildTargets(KING_OFFSETS)
+KING_ATTACKS = buildMasks(KING_TARGETS)
+PAWN_TARGETS = {color: buildTargets(offsets) for color, offsets in PAWN_CAPTURE_OFFSETS.items()} #capture squares only
+PAWN_ATTACKS = {color: buildMasks(targets) for color, targets in PAWN_TARGETS.items()}
+
+"""
+Attack tables for the sliding pieces: rooks, bishops and queens. The squares a slider attacks depend on its square and
+on the pieces blocking its rays, but only the blockers inside its "relevant" mask matter (the rays without the edge
+squares, since a piece on the edge can't hide anything behind it). For every square we enumerate all blocker subsets
+of the relevant mask and store the attack set in a dictionary keyed by that subset. Like a PEXT or magic bitboard
+lookup this is a perfect hash, except that Python's integer hashing takes the place of the magic multiplication,
+so one slider's attack set costs a single mask and a single lookup.
+"""
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1)) #up, left, down, right
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1)) #diagonals
+
+def rayAttacks(square, d, blockers): #squares attacked along direction d, up to and including the first blocker
+    row, col = square >> 3, square & 7
+    attacks = 0
+    row, col = row + d[0], col + d[1]
+    while 0 <= row < 8 and 0 <= col < 8:
+        bit = 1 << (row * 8 + col)
+        attacks |= bit
+        if blockers & bit:
+            break
+        row, col = row + d[0], col + d[1]
+    return attacks
+
+def relevantRay(square, d): #squares along direction d whose occupancy matters, the last square of the ray excluded
+    return rayAttacks(square, d, 0) & ~edgeOfRay(square, d)
+
+def edgeOfRay(square, d): #last square of an unblocked ray (0 if the ray is empty)
+    ray = rayAttacks(square, d, 0)
+    if not ray:
+        return 0
+    #rays going up or left run towards lower square indices, so their last square is the lowest bit
+    return ray & -ray if d[0] * 8 + d[1] < 0 else 1 << (ray.bit_length() - 1)
+
+def buildSlidingTables(directions): #relevant masks and attack dictionaries for all 64 squares
+    masks = []
+    tables = []
+    for square in range(64):
+        #every ray is independent, so first tabulate each ray on its own and then combine them
+        rays = []
+        for d in directions:
+            rayMask = relevantRay(square, d)
+            rayTable = {}
+            subset = 0
+            while True: #enumerate all subsets of the ray mask ("carry-rippler" trick)
+                rayTable[subset] = rayAttacks(square, d, subset)
+                subset = (subset - rayMask) & rayMask
+                if subset == 0:
+                    break
+            rays.append((rayMask, rayTable))
+        mask = 0
+        for (rayMask, rayTable) in rays:
+            mask |= rayMask
+        table = {}
+        subset = 0
+        while True:
+            attacks = 0
+            for (rayMask, rayTable) in rays:
+                attacks |= rayTable[subset & rayMask]
+            table[subset] = attacks
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+ROOK_MASKS, ROOK_TABLES = buildSlidingTables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = buildSlidingTables(BISHOP_DIRECTIONS)
+
+def rookAttacks(square, occupied): #squares attacked by a rook on square, given all occupied squares
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+
+def bishopAttacks(square, occupied): #squares attacked by a bishop on square, given all occupied squares
+    return BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+def queenAttacks(square, occupied): #a queen attacks like a rook and a bishop combined
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]] | BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+"""
+Line tables used for check and pin detection. BETWEEN[a][b] holds the squares strictly between a and b, and LINE[a][b]
+holds the whole line (rank, file or diagonal) through both squares. Both are 0 if the squares don't share a line.
+"""
+def buildLineTables():
+    between = [[0] * 64 for square in range(64)]
+    line = [[0] * 64 for square in range(64)]
+    for square in range(64):
+        for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            fullLine = rayAttacks(square, d, 0) | rayAttacks(square, (-d[0], -d[1]), 0) | 1 << square
+            squaresBetween = 0
+            row, col = (square >> 3) + d[0], (square & 7) + d[1]
+            while 0 <= row < 8 and 0 <= col < 8: #walk along the ray, remembering the squares passed so far
+                between[square][row * 8 + col] = squaresBetween
+                line[square][row * 8 + col] = fullLine
+                squaresBetween |= 1 << (row * 8 + col)
+                row, col = row + d[0], col + d[1]
+    return between, line
+
+BETWEEN, LINE = buildLineTables()
+
+FILE_A = 0x0101010101010101 #squares with col 0
+FILE_H = FILE_A << 7 #squares with col 7
+
+def pawnAttacks(color, pawns): #every square attacked by a set of pawns of the given color, computed set-wise
+    if color == "w": #white pawns capture towards row 0
+        return ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+    return (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL_BOARD
@@ -1,9 +1,25 @@
 import random
+import time
 
-import pygame as p
+from chess_pieces import Piece, EN_PASSANT, PROMOTION, PROMOTION_PIECES, FLAGS
+from bitboards import COLOR_PIECES, OPPONENT
+from transposition_table import TranspositionTable, EXACT, LOWER, UPPER
+
+#move ordering keys, the move with the highest key is searched first (see ChessAI.orderMoves)
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000 #plus 1000 * victim value minus attacker value
+LOSING_CAPTURE_SCORE = -100000 #plus 1000 * the (negative) static exchange score, below every quiet move
+KILLER_SCORES = (90000, 89000) #the newest killer first
+HISTORY_LIMIT = 50000 #history scores of quiet moves are capped below the killers
+ASPIRATION_WINDOW = 1 #half the width of the first aspiration window, in pawns
+NULL_MOVE_MATERIAL = 5 #the side to move needs more than this in knights, bishops, rooks and queens to try a null move
+LATE_MOVE_INDEX = 3 #quiet moves from this position in the move order on are searched with less depth
+DELTA_MARGIN = 2 #a capture is skipped in the quiescence search if even winning this much more wouldn't raise alpha
+SINGULAR_DEPTH = 4 #the hash move is only tested for a singular extension from this depth on
+SINGULAR_MARGIN = 1 #every other move has to score this much less than the hash move, in pawns
 
 class ChessAI:
-    def __init__(self):
+    def __init__(self, tableSizeMB = 16):
         #in order to implement the algorithms, we need to assign a value to each piece.
         #we define a dictionary of pieces, mapped to their value on the chess board
         self.pieceValue = { 
@@ -14,8 +30,39 @@ class ChessAI:
                 "Q": 9, 
                 "K": 1000 #cannot be captured
                 }
-        self.CHECKMATE = 1000  #if positive, white wins, if negative, black wins
+        #search scores (bestScore and the table scores) are for the side to move: CHECKMATE if it mates, -CHECKMATE if it
+        #is mated. Only scoreMaterial counts from white's point of view
+        self.CHECKMATE = 1000
         self.STALEMATE = 0 #always better than a losing position
+        self.INFINITY = self.CHECKMATE + 1 #larger than any score the search can return
+        self.MAX_DEPTH = 64 #deepest iteration of a timed search, mate scores are never closer than this to CHECKMATE
+
+        self.chess_piece = Piece() #used by the search to generate moves
+        self.nodes = 0 #positions visited by the last search
+        self.quiescenceNodes = 0 #the part of them visited by the quiescence search
+        self.completedDepth = 0 #depth of the last iteration the last search finished
+        self.bestScore = 0 #score of the move returned by the last search, for the side to move
+        self.hardDeadline = None #perf_counter time at which a timed search has to stop, None for no limit
+        self.stopped = False #set when the hard deadline passes, so every level of the search returns at once
+        #kept for the whole game, so positions searched for the previous move are still known
+        self.transpositionTable = TranspositionTable(tableSizeMB)
+        self.killers = [[0, 0] for ply in range(self.MAX_DEPTH + 1)] #two quiet moves per ply that caused a cutoff
+        self.history = [0] * 4096 #score of every (initial square, final square) pair, raised when a quiet move causes a cutoff
+        self.orderingStats = {}
+        self.searchStats = {} #how often the search had to search a position again or could prune it, see search()
+        #every pruning and reduction technique can be switched off, to measure what it saves
+        self.nullMovePruning = True
+        self.lateMoveReductions = True
+        self.futilityPruning = True
+        self.reverseFutilityPruning = True
+        #and so can every extension
+        self.checkExtension = True
+        self.recaptureExtension = True
+        self.singularExtension = True
+        self.maxExtensions = 0 #plies a single line can be extended by in the current iteration, see search()
+        #how far a quiet move can change the score within 1, 2 or 3 plies: a pawn, a minor piece, a rook
+        self.futilityMargins = (0, self.pieceValue["P"], self.pieceValue["N"], self.pieceValue["R"])
+        self.iterationNodes = [] #nodes searched by every finished iteration of the last search
 
     def findRandomMove(self, validMoves): #used if algorithm can't come up with a move (endgames)
         return validMoves[random.randint(0, len(validMoves)-1)] #random move from list of valid ones
@@ -43,7 +90,7 @@ class ChessAI:
                     score = -self.CHECKMATE * (-turnMultiplier) #current score of the board
                 elif engine.stalemate:
                     score = self.STALEMATE
-                score = self.scoreMaterial(engine.board) * (-turnMultiplier)
+                score = self.scoreMaterial(engine) * (-turnMultiplier)
                 if score > opponentMaxScore: #check if score is larger than opponent's max score so far
                     opponentMaxScore = score #if so, it becomes new max
                 #greedy algorithm end
@@ -56,14 +103,487 @@ class ChessAI:
             engine.undo_move()
         return bestPlayerMove
 
-    def scoreMaterial(self, board): #keep track of scores
+    def scoreMaterial(self, engine): #keep track of scores
         score = 0
-         #look at each space and see if there is a piece there
+         #look at each piece that is still on the board, using the engine's piece lists instead of all 64 squares
          #if that piece is a white or black piece, we'll score based on its value in the dictionary
-        for row in board:
-            for square in row:
-                if square[0] == "w":
-                    score += self.pieceValue[square[1]]
-                elif square[0] == "b":
-                    score -= self.pieceValue[square[1]]
+        for piece in engine.pieceLists["w"].values():
+            score += self.pieceValue[piece[1]]
+        for piece in engine.pieceLists["b"].values():
+            score -= self.pieceValue[piece[1]]
+        return score
+
+    """
+    Negamax with alpha-beta pruning. Negamax uses the fact that a position is exactly as good for one side as it is bad
+    for the other, so every node maximizes its own score and negates the scores of its children, instead of switching
+    between a maximizing and a minimizing player. Alpha is the score the side to move is already sure of and beta the
+    score the opponent is already sure of: once a move scores beta or more, the opponent will never allow this position,
+    so the remaining moves don't need to be searched.
+    A checkmate scores CHECKMATE minus the number of plies it takes, so a faster mate is preferred and a slower one
+    is chosen when being mated.
+    """
+    def findBestMove(self, engine, depth): #best move for the side to move, searching depth plies ahead, None if there is none
+        return self.search(engine, min(depth, self.MAX_DEPTH), None, None)
+
+    """
+    A timed search uses iterative deepening: it searches 1 ply deep, then 2, then 3 and so on until time runs out.
+    The shallow iterations cost little next to the last one, and each one puts its best move first in the next
+    iteration, where it is most likely still the best move. There are two limits:
+    - soft (half the budget): no new iteration is started after it, since the next one takes several times longer
+    - hard (the whole budget): the running iteration is abandoned and the move of the last finished one is returned
+    """
+    def findTimedMove(self, engine, milliseconds, maxDepth = None): #best move found within milliseconds, None if there is none
+        start = time.perf_counter()
+        return self.search(engine, maxDepth or self.MAX_DEPTH, start + milliseconds / 2000, start + milliseconds / 1000)
+
+    def search(self, engine, maxDepth, softDeadline, hardDeadline): #iterative deepening up to maxDepth, deadlines are perf_counter times or None
+        checkMate, stalemate = engine.checkMate, engine.stalemate #the search changes these, the game shouldn't notice
+        self.nodes = 0
+        self.quiescenceNodes = 0
+        self.completedDepth = 0
+        self.bestScore = 0
+        self.iterationNodes = []
+        self.hardDeadline = hardDeadline
+        self.stopped = False
+        self.transpositionTable.newSearch()
+        self.killers = [[0, 0] for ply in range(self.MAX_DEPTH + 1)] #killers belong to the positions of one search
+        self.history = [score >> 1 for score in self.history] #halved, so older searches count less
+        self.orderingStats = {"cutoffs": 0, "firstMoveCutoffs": 0, "hashMoves": 0, "hashMoveCutoffs": 0,
+                              "killerMoves": 0, "killerCutoffs": 0}
+        self.searchStats = {"nullWindowSearches": 0, "pvsResearches": 0, "aspirationFailLows": 0, "aspirationFailHighs": 0,
+                            "nullMoveTries": 0, "nullMoveCutoffs": 0, "lmrReductions": 0, "lmrResearches": 0,
+                            "futilityPrunes": 0, "reverseFutilityPrunes": 0, "checkExtensions": 0,
+                            "recaptureExtensions": 0, "singularSearches": 0, "singularExtensions": 0, "seePrunes": 0}
+        entry = self.transpositionTable.probe(engine.hash) #the table may know the best move from the previous search
+        moves = [move for (key, move) in self.orderMoves(engine, engine.getValidMoves(self.chess_piece, engine),
+                                                         entry[0] if entry is not None else 0, 0)]
+        bestMove = moves[0] if moves else None #in case not even the first iteration finishes
+        for depth in range(1, maxDepth + 1):
+            if not moves:
+                break
+            nodes = self.nodes
+            self.maxExtensions = max(1, depth // 2) #so a line never gets more than half as long again
+            move, score = self.aspirationSearch(engine, moves, depth)
+            if self.stopped: #the iteration didn't finish, so its result can't be trusted
+                break
+            self.iterationNodes.append(self.nodes - nodes)
+            bestMove = move
+            self.bestScore = score
+            self.completedDepth = depth
+            self.transpositionTable.store(engine.hash, move, score, depth, EXACT)
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) >= self.CHECKMATE - self.MAX_DEPTH: #a forced mate was found, searching deeper won't change it
+                break
+            if softDeadline is not None and time.perf_counter() > softDeadline:
+                break
+        engine.checkMate, engine.stalemate = checkMate, stalemate
+        return bestMove
+
+    """
+    Aspiration windows: the score of an iteration is usually close to the score of the one before, so the root is
+    searched with a narrow window around it, which prunes far more than the full window. If the score falls outside
+    the window (fail low or fail high), it is only a bound, and the root is searched again with the window widened on
+    that side, twice as far each time.
+    """
+    def aspirationSearch(self, engine, moves, depth): #(best move, its score) at the root, like searchRoot with the full window
+        if depth == 1 or abs(self.bestScore) >= self.CHECKMATE - self.MAX_DEPTH: #no usable score from an earlier iteration
+            return self.searchRoot(engine, moves, depth, -self.INFINITY, self.INFINITY)
+        delta = ASPIRATION_WINDOW
+        alpha, beta = self.bestScore - delta, self.bestScore + delta
+        while True:
+            move, score = self.searchRoot(engine, moves, depth, alpha, beta)
+            if self.stopped:
+                return None, 0
+            delta *= 2
+            if score <= alpha:
+                self.searchStats["aspirationFailLows"] += 1
+                alpha = max(score - delta, -self.INFINITY)
+            elif score >= beta:
+                self.searchStats["aspirationFailHighs"] += 1
+                beta = min(score + delta, self.INFINITY)
+            else:
+                return move, score
+
+    def effectiveBranchingFactor(self): #how many times more nodes the last iteration needed than the one before
+        if len(self.iterationNodes) < 2 or self.iterationNodes[-2] == 0:
+            return 0.0
+        return self.iterationNodes[-1] / self.iterationNodes[-2]
+
+    def searchRoot(self, engine, moves, depth, alpha, beta): #(best move, its score) at the root, searching moves in the given order
+        bestMove = None
+        bestScore = -self.INFINITY
+        for (index, move) in enumerate(moves):
+            engine.makeMove(move)
+            score = self.searchChild(engine, depth - 1, alpha, beta, 1, index == 0, 0)
+            engine.undo_move()
+            if self.stopped:
+                return None, 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return bestMove, bestScore
+
+    """
+    Principal variation search: with good move ordering the first move is usually the best one. So only the first move
+    is searched with the full window. Every other move is searched with a null window (alpha, alpha + 1), which only
+    proves that it is no better than alpha and prunes much more. If that proof fails and the move lands between alpha
+    and beta, it really is better, and it is searched again with the full window to find its exact score.
+    """
+    def searchChild(self, engine, depth, alpha, beta, ply, firstMove, extended): #score of the move just made, for the side that made it
+        if firstMove:
+            return -self.negamax(engine, depth, -beta, -alpha, ply, True, extended)
+        self.searchStats["nullWindowSearches"] += 1
+        score = -self.negamax(engine, depth, -alpha - 1, -alpha, ply, True, extended)
+        if alpha < score < beta and not self.stopped:
+            self.searchStats["pvsResearches"] += 1
+            score = -self.negamax(engine, depth, -beta, -alpha, ply, True, extended)
+        return score
+
+    """
+    Late move reductions: with good move ordering, a quiet move far down the list rarely turns out best. So late quiet
+    moves are first searched one ply shallower (two for very late moves in deep searches) with a null window. Only if
+    that reduced search scores above alpha, the move is searched again at full depth.
+    """
+    def searchLateMove(self, engine, depth, alpha, beta, ply, index, extended): #score of the late quiet move just made, for the side that made it
+        reduction = 2 if depth >= 6 and index >= 3 * LATE_MOVE_INDEX else 1
+        self.searchStats["lmrReductions"] += 1
+        score = -self.negamax(engine, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1, True, extended)
+        if score > alpha and not self.stopped:
+            self.searchStats["lmrResearches"] += 1
+            score = self.searchChild(engine, depth - 1, alpha, beta, ply + 1, False, extended)
+        return score
+
+    """
+    Null-move pruning: if the side to move could pass and a shallower search still scores at least beta, its position is
+    so strong that a real move would almost certainly score at least beta too, so the position is cut off early.
+    The null move search is R plies shallower than a normal one, R = 3 at depth 6 and more, otherwise 2. It is not tried:
+    - in check, where passing would leave the king in check
+    - twice in a row, or when the static score is already below beta
+    - when the side to move has little besides pawns: in such endgames any move can make the position worse (zugzwang),
+      so passing would look better than every real move and the pruning would be wrong
+    - in principal variation nodes, whose exact score is needed
+    """
+    """
+    Extensions do the opposite of the reductions: a few kinds of moves are searched one ply deeper, since the position
+    they lead to is forcing and a search that stops there would misjudge it.
+    - check: a position in check has few replies, and stopping in it easily misses a mate or a lost piece
+    - recapture: taking back a piece that just took one of the same value finishes the trade instead of stopping halfway
+    - singular: if the transposition table has a good score for the hash move, and a shallower search with the hash move
+      left out (excludedMove) shows that every other move scores at least SINGULAR_MARGIN less, the hash move is the
+      only good move, and a mistake in it would change the score of the position, so it is searched more carefully
+    A move gets at most one extension, and all extensions of one line (extended) are limited to maxExtensions, since
+    lines of checks and exchanges could otherwise be extended without end.
+    """
+    def negamax(self, engine, depth, alpha, beta, ply, allowNull = True, extended = 0, excludedMove = 0): #score of the position for the side to move, ply = distance from the root
+        if depth <= 0:
+            return self.quiescence(engine, alpha, beta, ply)
+        self.nodes += 1
+        #looking at the clock costs time as well, so only do it every 256 positions (a few milliseconds)
+        if self.hardDeadline is not None and self.nodes & 255 == 0 and time.perf_counter() > self.hardDeadline:
+            self.stopped = True
+        if self.stopped:
+            return 0
+        inCheck = engine.inCheck(self.chess_piece, engine)
+        if inCheck and self.checkExtension and extended < self.maxExtensions:
+            self.searchStats["checkExtensions"] += 1
+            depth += 1
+            extended += 1
+        hashMove = 0
+        entry = self.transpositionTable.probe(engine.hash)
+        if entry is not None:
+            (hashMove, tableScore, entryDepth, bound) = entry
+            tableScore = self.scoreFromTable(tableScore, ply)
+            #searched at least as deep before, so the stored result is good enough, unless a move is left out
+            if entryDepth >= depth and not excludedMove:
+                if (bound == EXACT or (bound == LOWER and tableScore >= beta)
+                        or (bound == UPPER and tableScore <= alpha)):
+                    return tableScore
+        #the pruning below only applies to null window nodes, away from mate scores and not in check
+        canPrune = beta - alpha == 1 and not inCheck and abs(beta) < self.CHECKMATE - self.MAX_DEPTH
+        staticScore = self.scoreMaterial(engine) if engine.whiteTurn else -self.scoreMaterial(engine)
+        if self.reverseFutilityPruning and canPrune and depth <= 3 and staticScore - self.futilityMargins[depth] >= beta:
+            self.searchStats["reverseFutilityPrunes"] += 1
+            return staticScore - self.futilityMargins[depth]
+        if (self.nullMovePruning and allowNull and canPrune and depth >= 3 and staticScore >= beta
+                and self.pieceMaterial(engine) > NULL_MOVE_MATERIAL):
+            self.searchStats["nullMoveTries"] += 1
+            reduction = 3 if depth >= 6 else 2
+            engine.makeNullMove()
+            score = -self.negamax(engine, depth - 1 - reduction, -beta, -beta + 1, ply + 1, False, extended)
+            engine.undoNullMove()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                self.searchStats["nullMoveCutoffs"] += 1
+                return beta if score >= self.CHECKMATE - self.MAX_DEPTH else score #a mate found after passing isn't real
+        moves = engine.getValidMoves(self.chess_piece, engine)
+        if not moves:
+            return -self.CHECKMATE + ply if engine.checkMate else self.STALEMATE
+        singularMove = 0
+        if (self.singularExtension and not excludedMove and hashMove and depth >= SINGULAR_DEPTH
+                and bound != UPPER and entryDepth >= depth - 3 and abs(tableScore) < self.CHECKMATE - self.MAX_DEPTH
+                and extended < self.maxExtensions):
+            self.searchStats["singularSearches"] += 1
+            singularBeta = tableScore - SINGULAR_MARGIN
+            score = self.negamax(engine, depth // 2, singularBeta - 1, singularBeta, ply, False, extended, hashMove)
+            if self.stopped:
+                return 0
+            if score < singularBeta: #every other move fails low
+                singularMove = hashMove
+        recaptureSquare = self.recaptureSquare(engine)
+        originalAlpha = alpha
+        bestScore = -self.INFINITY
+        bestMove = 0
+        stats = self.orderingStats
+        #futility pruning: close to the leaves, quiet moves can't make up for being this far below alpha
+        futile = self.futilityPruning and canPrune and depth <= 3 and staticScore + self.futilityMargins[depth] <= alpha
+        reduce = self.lateMoveReductions and depth >= 3 and not inCheck
+        for (index, (key, move)) in enumerate(self.orderMoves(engine, moves, hashMove, ply)):
+            if move == excludedMove:
+                continue
+            if key == HASH_MOVE_SCORE:
+                stats["hashMoves"] += 1
+            elif key in KILLER_SCORES:
+                stats["killerMoves"] += 1
+            extension = 0
+            if move == singularMove:
+                self.searchStats["singularExtensions"] += 1
+                extension = 1
+            elif (self.recaptureExtension and (move >> 6) & 63 == recaptureSquare and extended < self.maxExtensions):
+                self.searchStats["recaptureExtensions"] += 1
+                extension = 1
+            quiet = self.isQuiet(engine, move)
+            engine.makeMove(move)
+            if index > 0 and quiet and (futile or (reduce and index >= LATE_MOVE_INDEX and key not in KILLER_SCORES)):
+                if engine.inCheck(self.chess_piece, engine): #moves that give check are never pruned or reduced
+                    score = self.searchChild(engine, depth - 1, alpha, beta, ply + 1, False, extended)
+                elif futile:
+                    engine.undo_move()
+                    self.searchStats["futilityPrunes"] += 1
+                    bestScore = max(bestScore, staticScore + self.futilityMargins[depth]) #the most the move could score
+                    continue
+                else:
+                    score = self.searchLateMove(engine, depth, alpha, beta, ply, index, extended)
+            else:
+                score = self.searchChild(engine, depth - 1 + extension, alpha, beta, ply + 1, index == 0,
+                                         extended + extension)
+            engine.undo_move()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta: #the opponent won't allow this position, stop searching it
+                        stats["cutoffs"] += 1
+                        if index == 0:
+                            stats["firstMoveCutoffs"] += 1
+                        if key == HASH_MOVE_SCORE:
+                            stats["hashMoveCutoffs"] += 1
+                        elif key in KILLER_SCORES:
+                            stats["killerCutoffs"] += 1
+                        if quiet: #captures are ordered well already, remember quiet moves that refute
+                            killers = self.killers[min(ply, self.MAX_DEPTH)] #extensions can take ply past MAX_DEPTH
+                            if killers[0] != move:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self.history[move & 4095] += depth * depth #cutoffs far from the leaves save more work
+                        break
+        if bestScore >= beta:
+            bound = LOWER
+        elif bestScore > originalAlpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        if not excludedMove: #the result without the best move isn't the result of the position
+            self.transpositionTable.store(engine.hash, bestMove, self.scoreToTable(bestScore, ply), depth, bound)
+        return bestScore
+
+    """
+    Scoring a position in the middle of an exchange is misleading: after QxP the queen may be taken back on the next move,
+    but a search that stops right after QxP only sees the extra pawn (the horizon effect). So at the end of the regular
+    search, the quiescence search keeps going with captures and promotions only, until the position is quiet.
+    - stand pat: the side to move doesn't have to capture, so the static score is a lower bound and may cut off at once
+    - delta pruning: a capture that can't raise the score to alpha, even with DELTA_MARGIN extra, isn't searched
+    - a capture that loses material by static exchange evaluation isn't searched either
+    In check there is no standing pat, and all legal moves are searched so that checkmate is still recognized.
+    """
+    def quiescence(self, engine, alpha, beta, ply): #score of the position for the side to move once the captures have been played out
+        self.nodes += 1
+        self.quiescenceNodes += 1
+        if self.hardDeadline is not None and self.nodes & 255 == 0 and time.perf_counter() > self.hardDeadline:
+            self.stopped = True
+        if self.stopped:
+            return 0
+        standPat = self.scoreMaterial(engine) if engine.whiteTurn else -self.scoreMaterial(engine)
+        if ply >= self.MAX_DEPTH:
+            return standPat
+        inCheck = engine.inCheck(self.chess_piece, engine)
+        if inCheck:
+            moves = engine.getValidMoves(self.chess_piece, engine)
+            if not moves:
+                return -self.CHECKMATE + ply
+            bestScore = -self.INFINITY
+        else:
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            bestScore = standPat
+            moves = engine.getValidCaptures(self.chess_piece, engine)
+        for (key, move) in self.orderMoves(engine, moves, 0, ply):
+            if not inCheck and key < LOSING_CAPTURE_SCORE: #orderMoves found that the capture loses material
+                self.searchStats["seePrunes"] += 1
+                continue
+            if not inCheck and standPat + self.captureGain(engine, move) + DELTA_MARGIN <= alpha:
+                continue
+            engine.makeMove(move)
+            score = -self.quiescence(engine, -beta, -alpha, ply + 1)
+            engine.undo_move()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return bestScore
+
+    def captureGain(self, engine, move): #material won by a capture or promotion, not counting a recapture
+        victim = engine.board[(move >> 9) & 7][(move >> 6) & 7]
+        gain = self.pieceValue[victim[1]] if victim != "  " else (1 if move & FLAGS == EN_PASSANT else 0)
+        if move >= PROMOTION: #the pawn turns into a more valuable piece
+            gain += self.pieceValue[PROMOTION_PIECES[(move >> 12) & 3]] - 1
+        return gain
+
+    """
+    Static exchange evaluation: the material a capture wins once both sides have taken back on its square as long as
+    it pays off, found without making any moves. Every time the side to recapture takes with its least valuable
+    attacker, whose square is then removed from the occupied squares, so that a slider standing behind it (an x-ray)
+    now attacks the square as well. Working backwards through the captures, each side stops recapturing once that
+    would lose material. Pins are ignored, and a king only recaptures if the square isn't attacked anymore.
+    """
+    def staticExchange(self, engine, move): #material the side to move wins with the capture or promotion, in pawns
+        pieceValue = self.pieceValue
+        bitboards = engine.bitboards
+        square = (move >> 6) & 63
+        piece = engine.board[(move >> 3) & 7][move & 7]
+        occupied = (engine.occupancy["w"] | engine.occupancy["b"]) ^ (1 << (move & 63))
+        if move & FLAGS == EN_PASSANT: #the captured pawn is beside the square, not on it
+            occupied ^= 1 << ((move & 63 & ~7) | (square & 7))
+        gains = [self.captureGain(engine, move)]
+        #value of the piece on the square, which the next capture takes
+        onSquare = pieceValue[PROMOTION_PIECES[(move >> 12) & 3]] if move >= PROMOTION else pieceValue[piece[1]]
+        color = OPPONENT[piece[0]]
+        while True:
+            attackers = engine.attackersTo(square, color, occupied) & occupied
+            if not attackers:
+                break
+            for attacker in COLOR_PIECES[color]: #pawns first, the king last
+                if attackers & bitboards[attacker]:
+                    break
+            bit = attackers & bitboards[attacker]
+            bit &= -bit
+            if attacker[1] == "K" and engine.attackersTo(square, OPPONENT[color], occupied ^ bit) & (occupied ^ bit):
+                break #the king can't take back on a defended square
+            gains.append(onSquare - gains[-1])
+            onSquare = pieceValue[attacker[1]]
+            occupied ^= bit
+            color = OPPONENT[color]
+        for capture in range(len(gains) - 1, 0, -1): #a side only takes if it doesn't lose by it
+            gains[capture - 1] = -max(-gains[capture - 1], gains[capture])
+        return gains[0]
+
+    """
+    Alpha-beta prunes the most when the best move is searched first, so the moves of every position are sorted by how
+    likely they are to be best:
+    1) the hash move, the best move the transposition table remembers for this position
+    2) captures and promotions, most valuable victim first and among those the least valuable attacker first (MVV-LVA)
+    3) killer moves, quiet moves that caused a cutoff at the same ply in another position of the search
+    4) all other quiet moves, by their history score: how often and how deep they caused cutoffs anywhere in the search
+    5) captures and promotions that lose material by static exchange evaluation, the least losing first
+    A capture can only lose material if the capturing piece is worth more than what it wins, so only those captures
+    need the static exchange evaluation.
+    """
+    def orderMoves(self, engine, moves, hashMove, ply): #list of (key, move), sorted with the most promising move first
+        board = engine.board
+        pieceValue = self.pieceValue
+        killers = self.killers[min(ply, self.MAX_DEPTH)] #the quiescence search can go deeper than MAX_DEPTH
+        history = self.history
+        scored = []
+        for move in moves:
+            if move == hashMove:
+                scored.append((HASH_MOVE_SCORE, move))
+                continue
+            if board[(move >> 9) & 7][(move >> 6) & 7] != "  " or move >= PROMOTION or move & FLAGS == EN_PASSANT:
+                gain = self.captureGain(engine, move)
+                attackerValue = pieceValue[board[(move >> 3) & 7][move & 7][1]]
+                #the piece left on the square, which the opponent may take back
+                value = pieceValue[PROMOTION_PIECES[(move >> 12) & 3]] if move >= PROMOTION else attackerValue
+                if value > gain:
+                    exchange = self.staticExchange(engine, move)
+                    if exchange < 0:
+                        scored.append((LOSING_CAPTURE_SCORE + 1000 * exchange, move))
+                        continue
+                scored.append((CAPTURE_SCORE + 1000 * gain - attackerValue, move))
+            elif move == killers[0]:
+                scored.append((KILLER_SCORES[0], move))
+            elif move == killers[1]:
+                scored.append((KILLER_SCORES[1], move))
+            else:
+                scored.append((min(history[move & 4095], HISTORY_LIMIT), move))
+        scored.sort(reverse = True)
+        return scored
+
+    def pieceMaterial(self, engine): #value of the knights, bishops, rooks and queens of the side to move
+        material = 0
+        for piece in engine.pieceLists["w" if engine.whiteTurn else "b"].values():
+            if piece[1] != "P" and piece[1] != "K":
+                material += self.pieceValue[piece[1]]
+        return material
+
+    def isQuiet(self, engine, move): #neither a capture nor a promotion
+        return engine.board[(move >> 9) & 7][(move >> 6) & 7] == "  " and move < PROMOTION and move & FLAGS != EN_PASSANT
+
+    def recaptureSquare(self, engine): #square the last move captured on if it can be taken back evenly, otherwise -1
+        #a null move logs no move but a state without a captured piece, so the last state always belongs to moveLog[-1]
+        if not engine.stateLog or engine.stateLog[-1][2] == "  ":
+            return -1
+        square = (engine.moveLog[-1] >> 6) & 63
+        #only a piece that took a piece of the same value, taking it back evens the trade out
+        if self.pieceValue[engine.board[square >> 3][square & 7][1]] != self.pieceValue[engine.stateLog[-1][2][1]]:
+            return -1
+        return square
+
+    def orderingReport(self): #hit rates of the move ordering in the last search, between 0 and 1
+        stats = self.orderingStats
+        return {
+            "firstMoveCutoffRate": stats["firstMoveCutoffs"] / stats["cutoffs"] if stats["cutoffs"] else 0.0,
+            "hashMoveHitRate": stats["hashMoveCutoffs"] / stats["hashMoves"] if stats["hashMoves"] else 0.0,
+            "killerHitRate": stats["killerCutoffs"] / stats["killerMoves"] if stats["killerMoves"] else 0.0
+            }
+
+    """
+    A mate score counts the plies from the root, but a stored position can come up again at another distance from the
+    root. So the table stores mate scores counted from the position itself, and they are converted back when read.
+    """
+    def scoreToTable(self, score, ply):
+        if score >= self.CHECKMATE - self.MAX_DEPTH:
+            return score + ply
+        if score <= -self.CHECKMATE + self.MAX_DEPTH:
+            return score - ply
+        return score
+
+    def scoreFromTable(self, score, ply):
+        if score >= self.CHECKMATE - self.MAX_DEPTH:
+            return score - ply
+        if score <= -self.CHECKMATE + self.MAX_DEPTH:
+            return score + ply
         return score
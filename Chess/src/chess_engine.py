@@ -7,10 +7,18 @@ A chess engine is a program that can analyze chess positions and make the best p
 It can be seen as an intelligent chess board.
 """
 
-import pygame as p
-
 from settings import Settings
-from chess_pieces import CastleRights
+from chess_pieces import (EN_PASSANT, CASTLE, PROMOTION, FLAGS, ALL_CASTLING_RIGHTS, CASTLING_MASKS,
+                          WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)
+from zobrist import PIECE_KEYS, BLACK_TO_MOVE_KEY, CASTLING_KEYS, enPassantKey
+from bitboards import (PIECES, COLOR_PIECES, OPPONENT, FULL_BOARD, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, LINE,
+                       rookAttacks, bishopAttacks, pawnAttacks)
+
+#FEN letters of the pieces and of the castling rights
+FEN_PIECES = {"P": "wP", "N": "wN", "B": "wB", "R": "wR", "Q": "wQ", "K": "wK",
+              "p": "bP", "n": "bN", "b": "bB", "r": "bR", "q": "bQ", "k": "bK"}
+FEN_CASTLING_RIGHTS = {"K": WHITE_KINGSIDE, "Q": WHITE_QUEENSIDE, "k": BLACK_KINGSIDE, "q": BLACK_QUEENSIDE}
+FEN_CASTLING_SQUARES = {"K": (7, 4, 7), "Q": (7, 4, 0), "k": (0, 4, 7), "q": (0, 4, 0)} #(king row, king col, rook col)
 
 class ChessEngine(): 
     def __init__(self): 
@@ -28,6 +36,14 @@ class ChessEngine():
         #has a piece moved?
         self.whiteTurn = True #white usually has the first turn
         self.moveLog = [] #to keep track of the moves made
+        """
+        A move can't be undone from the move alone: castling rights, the en passant square, the captured piece, the 
+        halfmove clock and the hash can't be worked out backwards. Before each move we push these as one small record
+        onto stateLog, and undo_move restores them exactly from it.
+        """
+        self.stateLog = []
+        self.halfmoveClock = 0 #moves since the last capture or pawn move, for the fifty-move rule
+        self.fullmoveNumber = 1 #starts at 1 and goes up after every move of black, as in FEN
        
        #keep track of king positions
         self.whiteKingPosition = (7, 4)
@@ -38,99 +54,285 @@ class ChessEngine():
 
         self.enPassantPossible = () #coordinate for the square where an en passant capture is possible
 
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        #copy rights from what is modified in the updateCastleRights function and store in log
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        self.castlingRights = ALL_CASTLING_RIGHTS #the four castling rights as the bits of one number (see chess_pieces.py)
         
+        """
+        The position is also stored as bitboards: one 64-bit integer per piece type and color, plus one occupancy mask
+        per color. Move generation works on these, while self.board is kept in sync as a view for the display.
+        """
+        self.bitboards = {}
+        self.occupancy = {}
+        #for each color, a dictionary that maps the square index of every piece of that color to the piece on it.
+        #this way move generation and evaluation only visit pieces that are still on the board
+        self.pieceLists = {}
+        self.hash = 0 #Zobrist key of the position, updated by every change to the position (see zobrist.py)
+        self.loadBitboards()
+        self.hashLog = [self.hash] #key of every position reached so far, kept alongside moveLog
+
+    def loadBitboards(self): #build the bitboards and piece lists from self.board
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {"w": 0, "b": 0}
+        self.pieceLists = {"w": {}, "b": {}}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "  ":
+                    self.bitboards[piece] |= 1 << (row * 8 + col)
+                    self.occupancy[piece[0]] |= 1 << (row * 8 + col)
+                    self.pieceLists[piece[0]][row * 8 + col] = piece
+        self.hash = self.computeHash()
+
+    def computeHash(self): #Zobrist key of the position computed from scratch
+        key = 0
+        for color in ("w", "b"):
+            for (square, piece) in self.pieceLists[color].items():
+                key ^= PIECE_KEYS[piece][square]
+        if not self.whiteTurn:
+            key ^= BLACK_TO_MOVE_KEY
+        return key ^ CASTLING_KEYS[self.castlingRights] ^ enPassantKey(self.enPassantPossible)
+
+    def setUpPosition(self): #after the board and the state variables have been set directly, rebuild everything derived from them
+        self.loadBitboards()
+        for (piece, color) in (("wK", "white"), ("bK", "black")):
+            if self.bitboards[piece] & (self.bitboards[piece] - 1) or not self.bitboards[piece]:
+                raise ValueError("the position must have exactly one %s king" % color)
+        whiteKing, blackKing = self.bitboards["wK"].bit_length() - 1, self.bitboards["bK"].bit_length() - 1
+        self.whiteKingPosition = (whiteKing >> 3, whiteKing & 7)
+        self.blackKingPosition = (blackKing >> 3, blackKing & 7)
+        self.moveLog = [] #the history before this position is unknown, so it can't be undone past it
+        self.stateLog = []
+        self.hashLog = [self.hash]
+        self.checkMate = False
+        self.stalemate = False
+
+    """
+    getPosition packs the current position, without the move history, into a small tuple of strings and numbers.
+    It pickles into a few hundred bytes, so it is a cheap way to hand a position to another process,
+    where fromPosition turns it back into an engine. The bitboards, piece lists and hash are rebuilt there.
+    """
+    def getPosition(self): #the position as (board, whiteTurn, castlingRights, enPassantPossible, halfmoveClock, fullmoveNumber)
+        board = "".join("".join(row) for row in self.board) #two characters per square, row by row
+        return (board, self.whiteTurn, self.castlingRights, self.enPassantPossible, self.halfmoveClock, self.fullmoveNumber)
+
+    @classmethod
+    def fromPosition(cls, position): #new engine set up from the result of getPosition, with an empty move history
+        engine = cls()
+        (board, engine.whiteTurn, engine.castlingRights, engine.enPassantPossible, engine.halfmoveClock,
+         engine.fullmoveNumber) = position
+        engine.board = [[board[(row * 8 + col) * 2:(row * 8 + col) * 2 + 2] for col in range(8)] for row in range(8)]
+        engine.setUpPosition()
+        return engine
+
+    """
+    FEN (Forsyth-Edwards Notation) describes a position in one line of text, for example the initial position:
+        rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1
+    The six fields are the board from row 0 (rank 8) down, with digits counting empty squares and uppercase letters for
+    white pieces, the side to move, the castling rights, the en passant square, the halfmove clock and the fullmove
+    number. Setting a position from FEN takes one pass over the text, instead of replaying the moves that lead to it.
+    """
+    @classmethod
+    def from_fen(cls, fen): #new engine set up from a FEN string, with an empty move history
+        fields = fen.split()
+        if len(fields) == 4: #the two counters are often left out
+            fields += ["0", "1"]
+        if len(fields) != 6:
+            raise ValueError("a FEN needs 4 or 6 fields: " + fen)
+        (placement, turn, castling, enPassant, halfmoveClock, fullmoveNumber) = fields
+        rows = placement.split("/")
+        if len(rows) != 8:
+            raise ValueError("a FEN board needs 8 ranks: " + fen)
+        engine = cls()
+        engine.board = []
+        for rank in rows:
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row += ["  "] * int(char)
+                elif char in FEN_PIECES:
+                    row.append(FEN_PIECES[char])
+                else:
+                    raise ValueError("unknown piece %r in FEN: %s" % (char, fen))
+            if len(row) != 8:
+                raise ValueError("a FEN rank needs 8 squares: " + fen)
+            engine.board.append(row)
+        if "wP" in engine.board[0] + engine.board[7] or "bP" in engine.board[0] + engine.board[7]:
+            raise ValueError("pawns can't stand on rank 1 or 8: " + fen)
+        if turn not in ("w", "b"):
+            raise ValueError("the side to move must be w or b: " + fen)
+        engine.whiteTurn = turn == "w"
+        engine.castlingRights = 0
+        if castling != "-":
+            for char in castling:
+                if char not in FEN_CASTLING_RIGHTS:
+                    raise ValueError("unknown castling right %r in FEN: %s" % (char, fen))
+                kingRow, kingCol, rookCol = FEN_CASTLING_SQUARES[char]
+                king, rook = ("wK", "wR") if char.isupper() else ("bK", "bR")
+                #a right only counts while the king and that rook are on their starting squares
+                if engine.board[kingRow][kingCol] == king and engine.board[kingRow][rookCol] == rook:
+                    engine.castlingRights |= FEN_CASTLING_RIGHTS[char]
+        if enPassant == "-":
+            engine.enPassantPossible = ()
+        elif len(enPassant) == 2 and enPassant[0] in "abcdefgh" and enPassant[1] == ("6" if engine.whiteTurn else "3"):
+            row, col = 8 - int(enPassant[1]), "abcdefgh".index(enPassant[0]) #rank 8 is row 0
+            #the square only counts if a pawn of the other side just passed it: empty, with that pawn right in front
+            pawnRow, pawn = (row + 1, "bP") if engine.whiteTurn else (row - 1, "wP")
+            if engine.board[row][col] == "  " and engine.board[pawnRow][col] == pawn:
+                engine.enPassantPossible = (row, col)
+            else:
+                engine.enPassantPossible = ()
+        else:
+            raise ValueError("invalid en passant square %r in FEN: %s" % (enPassant, fen))
+        if not (halfmoveClock.isdigit() and fullmoveNumber.isdigit()):
+            raise ValueError("the move counters must be numbers: " + fen)
+        engine.halfmoveClock = int(halfmoveClock)
+        engine.fullmoveNumber = int(fullmoveNumber)
+        engine.setUpPosition()
+        return engine
+
+    def to_fen(self): #the current position as a FEN string
+        rows = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "  ":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == "w" else piece[1].lower()
+            rows.append(rank + str(empty) if empty else rank)
+        castling = "".join(char for (char, right) in FEN_CASTLING_RIGHTS.items() if self.castlingRights & right) or "-"
+        if self.enPassantPossible == ():
+            enPassant = "-"
+        else:
+            enPassant = "abcdefgh"[self.enPassantPossible[1]] + str(8 - self.enPassantPossible[0])
+        return "%s %s %s %s %d %d" % ("/".join(rows), "w" if self.whiteTurn else "b", castling, enPassant,
+                                      self.halfmoveClock, self.fullmoveNumber)
+
+    #every change to the position goes through these two methods, so the board view, the bitboards and the piece lists never disagree
+    def addPiece(self, piece, row, col): #put piece on the empty square (row, col)
+        bit = 1 << (row * 8 + col)
+        self.board[row][col] = piece
+        self.bitboards[piece] |= bit
+        self.occupancy[piece[0]] |= bit
+        self.pieceLists[piece[0]][row * 8 + col] = piece
+        self.hash ^= PIECE_KEYS[piece][row * 8 + col] #XOR the piece in
+
+    def removePiece(self, row, col): #clear the square (row, col) and return the piece that was on it
+        piece = self.board[row][col]
+        if piece != "  ":
+            bit = 1 << (row * 8 + col)
+            self.board[row][col] = "  "
+            self.bitboards[piece] ^= bit
+            self.occupancy[piece[0]] ^= bit
+            del self.pieceLists[piece[0]][row * 8 + col]
+            self.hash ^= PIECE_KEYS[piece][row * 8 + col] #XOR the piece out
+        return piece
 
     #works for all moves with the exception of special rules
-    def makeMove(self, move): #this method will take in a move object so that we can access the methods in the Move() class 
-        self.board[move.initial_row][move.initial_col] = "  " #when a move is made, the initial square becomes empty
-        #the final square is occupied by the piece that was on the initial square
-        self.board[move.final_row][move.final_col] = move.pieceMoved 
+    def makeMove(self, move): #the move is packed into an integer (see chess_pieces.py), so no Move object is needed
+        initial_row, initial_col = (move >> 3) & 7, move & 7 #bits 0-5: initial square
+        final_row, final_col = (move >> 9) & 7, (move >> 6) & 7 #bits 6-11: final square
+        flag = move & FLAGS
+        #en passant captures the pawn next to the initial square (same row, next col) instead of the one on the final square
+        captured_row = initial_row if flag == EN_PASSANT else final_row
+        pieceCaptured = self.board[captured_row][final_col]
+        #store everything this move changes that can't be worked out from the move itself
+        self.stateLog.append((self.castlingRights, self.enPassantPossible, pieceCaptured, self.halfmoveClock, self.hash))
         self.moveLog.append(move) #log the moves so we kan keep track of them
+
+        if pieceCaptured != "  ":
+            self.removePiece(captured_row, final_col) #remove the captured piece
+        pieceMoved = self.removePiece(initial_row, initial_col) #when a move is made, the initial square becomes empty
+        #the final square is occupied by the piece that was on the initial square
+        #pawn promotion
+        if move >= PROMOTION: #the flags are the highest bits, and promotion is the largest flag
+            #the move says which piece to promote to. Flags 4-7 stand for N, B, R, Q, which are pieces 1-4 of each color
+            self.addPiece(COLOR_PIECES[pieceMoved[0]][(move >> 12) - 3], final_row, final_col)
+        else:
+            self.addPiece(pieceMoved, final_row, final_col)
         
         #update king's position if moved
-        if move.pieceMoved == "wK": #to consider checks, we want to keep track of the king's position
-            self.whiteKingPosition = (move.final_row, move.final_col)
-        elif move.pieceMoved == "bK":
-            self.blackKingPosition = (move.final_row, move.final_col)
-        
-        #pawn promotion
-        if move.isPawnPromotion:
-            promotedPiece = input("Promote to Q, R, B or N: ") #we can make the ui later
-            self.board[move.final_row][move.final_col] = move.pieceMoved[0] + promotedPiece
-            
-        #en passant
-        #if en passant move, must update the board to capture pawn
-        if move.isEnPassant:
-            self.board[move.initial_row][move.final_col] = "  " #capturing the pawn. same row, next col
+        if pieceMoved == "wK": #to consider checks, we want to keep track of the king's position
+            self.whiteKingPosition = (final_row, final_col)
+        elif pieceMoved == "bK":
+            self.blackKingPosition = (final_row, final_col)
         
         #update enPassantPossible variable
         #if pawn moves twice, next move can capture en passant
-        if move.pieceMoved[1] == "P" and abs(move.initial_row - move.final_row) == 2: 
-            self.enPassantPossible = ((move.initial_row + move.final_row) // 2, move.final_col) 
+        self.hash ^= enPassantKey(self.enPassantPossible) #XOR the old en passant square out and the new one in
+        if pieceMoved[1] == "P" and abs(initial_row - final_row) == 2: 
+            self.enPassantPossible = ((initial_row + final_row) // 2, final_col) 
             #(1 square behind pawn, same initial col)
             #// = integer division
         else: 
             self.enPassantPossible = () #reset 
+        self.hash ^= enPassantKey(self.enPassantPossible)
 
         #castle move
-        if move.isCastle:
-            if move.final_col - move.initial_col == 2: #if kingside castle move/click
-                #move rook into new square
-                self.board[move.final_row][move.final_col-1] = self.board[move.final_row][move.final_col+1]
-               #remove rook from earlier square
-                self.board[move.final_row][move.final_col+1] = "  " 
+        if flag == CASTLE:
+            if final_col - initial_col == 2: #if kingside castle move/click
+                #move rook into new square and remove it from its earlier square
+                self.addPiece(self.removePiece(final_row, final_col+1), final_row, final_col-1)
             else: #otherwise it's a queenside castle
-                self.board[move.final_row][move.final_col+1] = self.board[move.final_row][move.final_col-2]
-                self.board[move.final_row][move.final_col-2] = "  " 
+                self.addPiece(self.removePiece(final_row, final_col-2), final_row, final_col+1)
+
+        #update castling rights - whenever a rook or a king moves, or a rook is captured on its starting square
+        castlingRights = self.castlingRights & CASTLING_MASKS[move & 63] & CASTLING_MASKS[(move >> 6) & 63]
+        if castlingRights != self.castlingRights:
+            self.hash ^= CASTLING_KEYS[self.castlingRights] ^ CASTLING_KEYS[castlingRights]
+            self.castlingRights = castlingRights
 
-        #update castling rights - whenever a rook or a king moves
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        if pieceMoved[1] == "P" or pieceCaptured != "  ":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
         
+        if not self.whiteTurn:
+            self.fullmoveNumber += 1
         self.whiteTurn = not self.whiteTurn #switch turns
+        self.hash ^= BLACK_TO_MOVE_KEY
+        self.hashLog.append(self.hash)
 
     def undo_move(self):
         if len(self.moveLog) != 0: #check if there is a move to undo
             move = self.moveLog.pop() #remove last move
-            self.board[move.initial_row][move.initial_col] = move.pieceMoved #place moved piece at earlier position
-            self.board[move.final_row][move.final_col] = move.pieceCaptured #place captured piece at earlier position
+            (castlingRights, enPassantPossible, pieceCaptured, halfmoveClock, hash) = self.stateLog.pop()
+            initial_row, initial_col = (move >> 3) & 7, move & 7
+            final_row, final_col = (move >> 9) & 7, (move >> 6) & 7
+            flag = move & FLAGS
+            pieceMoved = self.removePiece(final_row, final_col) #the moved (or promoted) piece leaves its final square
+            if move >= PROMOTION: #a promoted piece goes back as a pawn
+                pieceMoved = pieceMoved[0] + "P"
+            self.addPiece(pieceMoved, initial_row, initial_col) #place moved piece at earlier position
+            if pieceCaptured != "  ": #place captured piece at earlier position
+                #for en passant, that is the same initial row, next col, which leaves the landing square blank
+                self.addPiece(pieceCaptured, initial_row if flag == EN_PASSANT else final_row, final_col)
             #update king's position if needed
-            if move.pieceMoved == "wK": #to consider checks, we want to keep track of the king's position
-                self.whiteKingPosition = (move.initial_row, move.initial_col)
-            elif move.pieceMoved == "bK":
-                self.blackKingPosition = (move.initial_row, move.initial_col)
-            #undo en passant move
-            if move.isEnPassant:
-                #place captured piece at earlier position by leaving landing square blank
-                self.board[move.final_row][move.final_col] = "  "  
-                #place captured piece at earlier position, same initial row, next col
-                self.board[move.initial_row][move.final_col] = move.pieceCaptured
-                self.enPassantPossible = (move.final_row, move.final_col) #allow en passant to happen on the next move
-                #this way we are able to redo the en passant move
-                ##update enPassantPossible variable when undoing a 2 square pawn advance 
-                if move.pieceMoved[1] == "P" and abs(move.initial_row - move.final_row) == 2: #only on two square pawn advances
-                    self.enPassantPossible = ()
-            #undo castling rights
-            self.castleRightsLog.pop() #get rid of the new castle rights from the move we are undoing
-            self.currentCastlingRight = self.castleRightsLog[-1] #set current castle rights to the last one in the list
+            if pieceMoved == "wK": #to consider checks, we want to keep track of the king's position
+                self.whiteKingPosition = (initial_row, initial_col)
+            elif pieceMoved == "bK":
+                self.blackKingPosition = (initial_row, initial_col)
             #undo castle move
-            if move.isCastle:
-                if move.final_col - move.initial_col == 2: #if kingside castle 
-                        #move rook into old square
-                    self.board[move.final_row][move.final_col+1] = self.board[move.final_row][move.final_col-1]
-                    #remove rook from earlier square
-                    self.board[move.final_row][move.final_col-1] = "  "
+            if flag == CASTLE:
+                if final_col - initial_col == 2: #if kingside castle 
+                    #move rook into old square and remove it from its later square
+                    self.addPiece(self.removePiece(final_row, final_col-1), final_row, final_col+1)
                 else: #queenside
-                    self.board[move.final_row][move.final_col-2] = self.board[move.final_row][move.final_col+1]
-                    self.board[move.final_row][move.final_col+1] = "  "
+                    self.addPiece(self.removePiece(final_row, final_col+1), final_row, final_col-2)
 
+            #everything else comes straight from the record
+            self.castlingRights = castlingRights
+            self.enPassantPossible = enPassantPossible
+            self.halfmoveClock = halfmoveClock
+            self.hash = hash
  
             self.whiteTurn = not self.whiteTurn #swich turns
+            if not self.whiteTurn:
+                self.fullmoveNumber -= 1
+            self.hashLog.pop()
 
         """
         conditions that may prevent one from castling:
@@ -141,59 +343,35 @@ class ChessEngine():
             4) Your king has made any other move before.
             5) The rook you intend to castle with has already
             moved.
+        4) + 5) are handled by CASTLING_MASKS in makeMove, the others by getCastleMoves.
         """
-        #update castle right given a move 
-    def updateCastleRights(self, move): #4) + 5)
-        if move.pieceMoved == "wK": #if king moves, no castling
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == "wR": #white rooks
-            if move.initial_row == 7: #if rooks starting move
-                if move.initial_col == 0: #left rook
-                    self.currentCastlingRight.wqs = False #no castling
-                elif move.initial_col == 7: #right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == "bR": #white rooks
-            if move.initial_row == 0: #if rooks starting move
-                if move.initial_col == 0: #left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.initial_col == 7: #right rook
-                    self.currentCastlingRight.bks = False
             
-    def getValidMoves(self, chess_piece, engine): #all possible moves (considering checks)
-        #when not considering checks
-        #return self.getAllPossibleMoves()
-        tempEnPassantPossible = self.enPassantPossible
-        #copy current castle rights
-        tempCastleRights = (CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
-        #1.) generate all possible moves
-        moves = self.getAllPossibleMoves(chess_piece, engine)
+    """
+    A null move passes the turn without moving a piece. It isn't a legal chess move, but the AI uses it to ask "if I
+    could skip my move, would my position still be good enough?" (see ChessAI.negamax). Only the side to move, the
+    en passant square and the hash change, so it is much cheaper than a real move. It must not be made while in check.
+    """
+    def makeNullMove(self):
+        #the record has the same layout as the one of makeMove, so stateLog stays in order when both are mixed
+        self.stateLog.append((self.castlingRights, self.enPassantPossible, "  ", self.halfmoveClock, self.hash))
+        self.hash ^= enPassantKey(self.enPassantPossible) ^ BLACK_TO_MOVE_KEY #an en passant capture is no longer possible
+        self.enPassantPossible = ()
+        self.halfmoveClock += 1
+        if not self.whiteTurn:
+            self.fullmoveNumber += 1
+        self.whiteTurn = not self.whiteTurn
+        self.hashLog.append(self.hash)
 
-        """
-        instead of calling getCastleMoves from getKingMoves, we call it from getValidMoves
-        """
-        if self.whiteTurn:
-            chess_piece.getCastleMoves(self.whiteKingPosition[0], self.whiteKingPosition[1], moves, engine, chess_piece)
-        else:
-            chess_piece.getCastleMoves(self.blackKingPosition[0], self.blackKingPosition[1], moves, engine, chess_piece)
-
-
-        #2.) for each move, make the move
-        #when removing from a list, go backwards through that list to avoid bugs (like not removing all occurences of an element)
-        for i in range(len(moves)-1, -1, -1): 
-            self.makeMove(moves[i]) #this switches turns so we have to switch back
-            #3.) generate all opponent's moves
-            #4.) for each of the opponent's moves, see if they attack your king
-            self.whiteTurn = not self.whiteTurn #switch back to player
-            if self.inCheck(chess_piece, engine): #see if our king is in check
-                #5.) if they do, invalid move
-                moves.remove(moves[i]) #remove move from list of valid moves
-            self.whiteTurn = not self.whiteTurn #switch back to player
-            self.undo_move() #undo move from chess board
+    def undoNullMove(self): #undo the last move, which has to be a null move
+        #a null move neither changes the castling rights nor captures a piece
+        (_, self.enPassantPossible, _, self.halfmoveClock, self.hash) = self.stateLog.pop()
+        self.whiteTurn = not self.whiteTurn
+        if not self.whiteTurn:
+            self.fullmoveNumber -= 1
+        self.hashLog.pop()
+
+    def getValidMoves(self, chess_piece, engine): #all possible moves (considering checks)
+        moves = self.getLegalMoves(chess_piece, engine, False)
         if len(moves) == 0: #either checkmate or stalemate
             if self.inCheck(chess_piece, engine):
                 self.checkMate = True
@@ -202,18 +380,95 @@ class ChessEngine():
         else:
             self.checkMate = False
             self.stalemate = False
+        return moves
 
-            """
-            If we make a pawn move, and then undo that move, the value of enPassantPossible is going to change, 
-            as we make those moves, even though they don't show up on the board. That is why we store the value 
-            of this square in a temporary variable, and then reset it after this function is called. 
-            We want to save the value when generating our moves
-            """
-        
-        self.enPassantPossible = tempEnPassantPossible 
-        #since we're constantly doing and undoing moves, changing the value of the original variable as with en passant
-        self.currentCastlingRight = tempCastleRights 
-        return moves #for now we won't worry about checks
+    def getValidCaptures(self, chess_piece, engine): #legal captures and promotions only, for the quiescence search
+        #no list of all moves is made and then filtered: the targets of every piece are limited to enemy pieces instead.
+        #an empty list says nothing about checkmate or stalemate, so the flags are left alone
+        return self.getLegalMoves(chess_piece, engine, True)
+
+    def getLegalMoves(self, chess_piece, engine, capturesOnly):
+        """
+        Instead of making every possible move and looking for checks afterwards, we work out once per position which
+        enemy pieces give check and which of our pieces are pinned to our king, and only generate legal moves:
+            1) The king may go to any square the opponent doesn't attack.
+            2) In double check only the king can move.
+            3) In single check the other pieces have to capture the checking piece or block its ray.
+            4) A pinned piece can only move along the line between our king and the pinning piece.
+        """
+        if self.whiteTurn:
+            ally, enemy = "w", "b"
+            (kingRow, kingCol) = self.whiteKingPosition
+        else:
+            ally, enemy = "b", "w"
+            (kingRow, kingCol) = self.blackKingPosition
+        king = kingRow * 8 + kingCol
+        bitboards = self.bitboards
+        allies = self.occupancy[ally]
+        enemies = self.occupancy[enemy]
+        occupied = allies | enemies
+        (_, _, bishop, rook, queen, _) = COLOR_PIECES[enemy]
+        enemyRooks = bitboards[rook] | bitboards[queen] #pieces that attack along ranks and files
+        enemyBishops = bitboards[bishop] | bitboards[queen] #pieces that attack along diagonals
+
+        checkers = self.attackersTo(king, enemy, occupied) #enemy pieces that give check
+
+        #our pieces that are the only piece between an enemy slider and our king are pinned
+        pinned = 0
+        snipers = (rookAttacks(king, enemies) & enemyRooks) | (bishopAttacks(king, enemies) & enemyBishops)
+        while snipers:
+            lowestBit = snipers & -snipers
+            snipers ^= lowestBit
+            blockers = BETWEEN[king][lowestBit.bit_length() - 1] & occupied
+            if blockers & allies and not blockers & (blockers - 1): #exactly one piece in between, and it is ours
+                pinned |= blockers
+
+        #all squares the opponent attacks. Our king is left out of the occupancy so that it can't step back along a checking ray
+        attacked = self.getAttackedSquares(enemy, occupied ^ (1 << king))
+
+        moves = []
+        #1.) king moves
+        chess_piece.getKingMoves(kingRow, kingCol, moves, engine, ~attacked & enemies if capturesOnly else ~attacked)
+        if not checkers & (checkers - 1): #if not in double check, other pieces can move too
+            if checkers: #the check has to be captured or blocked
+                evasions = checkers | BETWEEN[king][checkers.bit_length() - 1]
+            else:
+                evasions = FULL_BOARD
+                """
+                instead of calling getCastleMoves from getKingMoves, we call it from getValidMoves
+                """
+                if not capturesOnly:
+                    chess_piece.getCastleMoves(kingRow, kingCol, moves, engine, attacked)
+            moveFunctions = chess_piece.captureFunctions if capturesOnly else chess_piece.moveFunctions
+            for (square, piece) in self.pieceLists[ally].items(): #only our pieces that are still on the board
+                if square == king: #the king moves were already added
+                    continue
+                targets = evasions & LINE[king][square] if pinned >> square & 1 else evasions #pinned pieces stay on the line through our king
+                if capturesOnly and piece[1] != "P": #pawns find their own captures, en passant and promotions don't land on an enemy piece
+                    targets &= enemies
+                moveFunctions[piece[1]](square >> 3, square & 7, moves, engine, targets)
+        return moves
+
+    def getAttackedSquares(self, color, occupied): #bitboard of every square attacked by the pieces of color
+        (pawn, knight, bishop, rook, queen, king) = COLOR_PIECES[color]
+        bitboards = self.bitboards
+        attacked = pawnAttacks(color, bitboards[pawn]) | KING_ATTACKS[bitboards[king].bit_length() - 1]
+        knights = bitboards[knight]
+        while knights:
+            lowestBit = knights & -knights
+            knights ^= lowestBit
+            attacked |= KNIGHT_ATTACKS[lowestBit.bit_length() - 1]
+        rooks = bitboards[rook] | bitboards[queen] #a queen attacks like a rook and a bishop
+        while rooks:
+            lowestBit = rooks & -rooks
+            rooks ^= lowestBit
+            attacked |= rookAttacks(lowestBit.bit_length() - 1, occupied)
+        bishops = bitboards[bishop] | bitboards[queen]
+        while bishops:
+            lowestBit = bishops & -bishops
+            bishops ^= lowestBit
+            attacked |= bishopAttacks(lowestBit.bit_length() - 1, occupied)
+        return attacked
     
     def inCheck(self, chess_piece, engine): #see if player is in check 
         if self.whiteTurn:
@@ -222,20 +477,31 @@ class ChessEngine():
             return self.squareAttacked(self.blackKingPosition[0], self.blackKingPosition[1], chess_piece, engine)
 
     def squareAttacked(self, row, col, chess_piece, engine): #see if enemy can attack your square (row, col)
-        self.whiteTurn = not self.whiteTurn # switch to opponent's pov
-        oppMoves = self.getAllPossibleMoves(chess_piece, engine)
-        self.whiteTurn = not self.whiteTurn #switch back to player's pov
-        for move in oppMoves:
-            if move.final_row == row and move.final_col == col: #square is under attack
-                return True
-        return False #square is not under attack
+        square = row * 8 + col
+        if self.whiteTurn: #attacks come from the opponent's pieces
+            return self.attackersTo(square, "b", self.occupancy["w"] | self.occupancy["b"]) != 0
+        return self.attackersTo(square, "w", self.occupancy["w"] | self.occupancy["b"]) != 0
+
+    def attackersTo(self, square, color, occupied): #bitboard of the pieces of color that attack square
+        """
+        Instead of generating all of the opponent's moves, we look outward from the square itself: a knight, king
+        or pawn attacks it if it stands on one of the squares in the attack table, and a slider attacks it if it is
+        the first piece met along a rook or bishop ray. Those rays come from the sliding attack tables as well.
+        The occupied squares are passed in, so that callers can ask what the attacks would be with pieces moved away.
+        No moves or lists are created, so this is cheap enough to call for every castling square and every frame.
+        """
+        (pawn, knight, bishop, rook, queen, king) = COLOR_PIECES[color]
+        bitboards = self.bitboards
+        #a pawn attacks the square if it stands where a pawn of the other color would capture from the square
+        return ((KNIGHT_ATTACKS[square] & bitboards[knight]) | (KING_ATTACKS[square] & bitboards[king])
+                | (PAWN_ATTACKS[OPPONENT[color]][square] & bitboards[pawn])
+                | (rookAttacks(square, occupied) & (bitboards[rook] | bitboards[queen]))
+                | (bishopAttacks(square, occupied) & (bitboards[bishop] | bitboards[queen])))
 
     def getAllPossibleMoves(self, chess_piece, engine): #all possible moves (not considering checks)
         moves = [] #we start with an empty list of moves
-        for row in range(len(self.board)): #number of rows
-            for col in range(len(self.board[row])): #number of cols in a given row
-                turn = self.board[row][col][0] #first character of a given square on a board which denotes the color. 
-                if (turn == "w" and self.whiteTurn) or (turn == "b" and not self.whiteTurn):
-                    piece = self.board[row][col][1]
-                    chess_piece.moveFunctions[piece](row, col, moves, engine) #calls the appropriate move function based on piece type         
-        return moves
\ No newline at end of file
+        turn = "w" if self.whiteTurn else "b" #color of the player to move
+        for (square, piece) in self.pieceLists[turn].items(): #only visit the squares that hold a piece of the player to move
+            #calls the appropriate move function based on piece type
+            chess_piece.moveFunctions[piece[1]](square >> 3, square & 7, moves, engine) #(row, col) = (square // 8, square % 8)
+        return moves
@@ -2,7 +2,27 @@
 This class will store information about the chess pieces, and all their valid moves
 """
 
-import pygame as p
+from bitboards import FULL_BOARD, KNIGHT_TARGETS, KING_TARGETS, PAWN_TARGETS, rookAttacks, bishopAttacks, queenAttacks
+
+"""
+Inside the engine, a move is packed into a 16-bit integer instead of a Move object:
+    bits 0-5: initial square (row * 8 + col)
+    bits 6-11: final square
+    bits 12-15: flag for special moves
+Most generated moves are thrown away by the AI, so Move objects are only created for the moves the player clicks,
+which compare equal to the packed move they stand for.
+"""
+EN_PASSANT = 1 << 12
+CASTLE = 2 << 12
+PROMOTION = 4 << 12 #promotions are the largest flags, so move >= PROMOTION tells us if a move is a promotion
+#the two lowest flag bits say which piece the pawn promotes to
+PROMOTION_PIECES = "NBRQ"
+PROMOTE_KNIGHT = 4 << 12
+PROMOTE_BISHOP = 5 << 12
+PROMOTE_ROOK = 6 << 12
+PROMOTE_QUEEN = 7 << 12
+PROMOTIONS = (PROMOTE_QUEEN, PROMOTE_ROOK, PROMOTE_BISHOP, PROMOTE_KNIGHT) #every promotion is generated as its own move
+FLAGS = 15 << 12 #mask for the flag bits
 
 class Piece:
     def __init__(self): #the different chess pieces
@@ -17,123 +37,132 @@ class Piece:
             "Q": self.getQueenMoves, 
             "K": self.getKingMoves
             }
+        #the same for captures only. getValidCaptures() limits the targets of the other pieces to enemy pieces,
+        #but a pawn captures on other squares than it moves to, so it has a generator of its own
+        self.captureFunctions = dict(self.moveFunctions, P = self.getPawnCaptures)
         
-        #self.currentCastlingRight = CastleRights(True, True, True, True)
-        
-    def getPawnMoves(self, row, col, moves, engine): #get all pawn moves for pawn at position (row, col) and add these to the list
+    """
+    Every move function takes an optional bitboard of target squares. Moves are only added if they land on one of those
+    squares, which is how getValidMoves() restricts pieces to check evasions and pinned pieces to their pin line. 
+    Without it, all squares are allowed and we get the possible moves that don't consider checks.
+    """
+    def getPawnMoves(self, row, col, moves, engine, targets = FULL_BOARD): #get all pawn moves for pawn at position (row, col) and add these to the list
+        occupied = engine.occupancy["w"] | engine.occupancy["b"] #squares that hold any piece
+        square = row * 8 + col
         if engine.whiteTurn: #white pawn moves
-            if engine.board[row-1][col] == "  ": #if pawn can move 1 square forward, add move
-                moves.append(Move((row, col), (row-1, col), engine.board))
-                if row == 6 and engine.board[row-2][col] == "  ": #if pawn can move 2 squares forward, add move
-                    moves.append(Move((row, col), (row-2, col), engine.board))
-            if col-1 >= 0: #captures to the left
-                if engine.board[row-1][col-1][0] == "b": #enemy piece to capture
-                    moves.append(Move((row, col), (row-1, col-1), engine.board))
-                elif (row-1, col-1) == engine.enPassantPossible: #if last enemy move was an en passant move
-                    #we need to tell our engine that it is okay to capture an empty square
-                    moves.append(Move((row, col), (row-1, col-1), engine.board, isEnPassant = True))
-            if col+1 <= 7: #captures to the right
-                if engine.board[row-1][col+1][0] == "b": #enemy piece to capture
-                    moves.append(Move((row, col), (row-1, col+1), engine.board))
-                elif (row-1, col+1) == engine.enPassantPossible: #if last enemy move was an en passant move
-                    moves.append(Move((row, col), (row-1, col+1), engine.board, isEnPassant = True))
+            enemies = engine.occupancy["b"]
+            promotes = row == 1 #a pawn that reaches row 0 promotes
+            if not occupied >> (square - 8) & 1: #if pawn can move 1 square forward, add move
+                if targets >> (square - 8) & 1:
+                    self.addPawnMove(square, square - 8, promotes, moves)
+                if row == 6 and not occupied >> (square - 16) & 1 and targets >> (square - 16) & 1: #if pawn can move 2 squares forward, add move
+                    moves.append(square | (square - 16) << 6)
+            for target in PAWN_TARGETS["w"][square]: #captures to the left and to the right
+                if enemies >> target & 1: #enemy piece to capture
+                    if targets >> target & 1:
+                        self.addPawnMove(square, target, promotes, moves)
+                elif (target >> 3, target & 7) == engine.enPassantPossible: #if last enemy move was an en passant move
+                    if self.canCaptureEnPassant(row, col, target, targets, engine):
+                        #we need to tell our engine that it is okay to capture an empty square
+                        moves.append(square | target << 6 | EN_PASSANT)
         
         else: #black pawn moves
-            if engine.board[row+1][col] == "  ": #if pawn can move 1 square forward, add move
-                moves.append(Move((row, col), (row+1, col), engine.board))
-                if row == 1 and engine.board[row+2][col] == "  ": #if pawn can move 2 squares forward, add move
-                    moves.append(Move((row, col), (row+2, col), engine.board))
-            if col-1 >= 0: #captures to the left
-                if engine.board[row+1][col-1][0] == "w": #enemy piece to capture
-                    moves.append(Move((row, col), (row+1, col-1), engine.board))
-                elif (row+1, col-1) == engine.enPassantPossible: #if last enemy move was an en passant move
-                    moves.append(Move((row, col), (row+1, col-1), engine.board, isEnPassant = True))
-            if col+1 <= 7: #captures to the right
-                if engine.board[row+1][col+1][0] == "w": #enemy piece to capture
-                    moves.append(Move((row, col), (row+1, col+1), engine.board))
-                elif (row+1, col+1) == engine.enPassantPossible: #if last enemy move was an en passant move
-                    moves.append(Move((row, col), (row+1, col+1), engine.board, isEnPassant = True))
+            enemies = engine.occupancy["w"]
+            promotes = row == 6 #a pawn that reaches row 7 promotes
+            if not occupied >> (square + 8) & 1: #if pawn can move 1 square forward, add move
+                if targets >> (square + 8) & 1:
+                    self.addPawnMove(square, square + 8, promotes, moves)
+                if row == 1 and not occupied >> (square + 16) & 1 and targets >> (square + 16) & 1: #if pawn can move 2 squares forward, add move
+                    moves.append(square | (square + 16) << 6)
+            for target in PAWN_TARGETS["b"][square]: #captures to the left and to the right
+                if enemies >> target & 1: #enemy piece to capture
+                    if targets >> target & 1:
+                        self.addPawnMove(square, target, promotes, moves)
+                elif (target >> 3, target & 7) == engine.enPassantPossible: #if last enemy move was an en passant move
+                    if self.canCaptureEnPassant(row, col, target, targets, engine):
+                        moves.append(square | target << 6 | EN_PASSANT)
             
-    #add pawn promotion later
+    def getPawnCaptures(self, row, col, moves, engine, targets = FULL_BOARD): #captures, en passant and promotions of the pawn at (row, col)
+        square = row * 8 + col
+        if engine.whiteTurn:
+            color, enemies, forward, promotes = "w", engine.occupancy["b"], square - 8, row == 1
+        else:
+            color, enemies, forward, promotes = "b", engine.occupancy["w"], square + 8, row == 6
+        #a promotion changes the material as much as a capture, so it belongs with the captures
+        if promotes and not (engine.occupancy["w"] | engine.occupancy["b"]) >> forward & 1 and targets >> forward & 1:
+            self.addPawnMove(square, forward, True, moves)
+        for target in PAWN_TARGETS[color][square]:
+            if enemies >> target & 1:
+                if targets >> target & 1:
+                    self.addPawnMove(square, target, promotes, moves)
+            elif (target >> 3, target & 7) == engine.enPassantPossible:
+                if self.canCaptureEnPassant(row, col, target, targets, engine):
+                    moves.append(square | target << 6 | EN_PASSANT)
 
-    def getRookMoves(self, row, col, moves, engine): #get all rook moves for rook at position (row, col) and add these to the list
-        rookDirections = ((-1, 0), (0, -1), (1, 0), (0, 1)) #up, left, down, right
-        if engine.whiteTurn: #determine the color of the enemy
-            enemyColor = "b"
+    def addPawnMove(self, square, target, promotes, moves): #add a pawn move, or all four promotions if the pawn promotes
+        if promotes:
+            for promotion in PROMOTIONS:
+                moves.append(square | target << 6 | promotion)
         else:
-             enemyColor = "w"
-        for d in rookDirections:
-            for i in range(1, 8): #rook max range
-                final_row = row + d[0] * i #starting row + its direction (up or down) * i
-                final_col = col + d[1] * i  #starting col + its direction (left or right) * i
-                if 0 <= final_row < 8 and 0 <= final_col < 8: # if position is on the board
-                    finalPiece = engine.board[final_row][final_col] #variable that stores final position
-                    if finalPiece == "  ": #if an empty space is available
-                        moves.append(Move((row, col), (final_row, final_col), engine.board))
-                    elif finalPiece[0] == enemyColor: #if an enemy piece can be captured
-                        moves.append(Move((row, col), (final_row, final_col), engine.board))
-                        break
-                    else: #friendly piece, cannot take
-                        break
-                else: #not on the board
-                    break
-
-    def getKnightMoves(self, row, col, moves, engine): #get all knight moves for knight at position (row, col) and add these to the list       
-            knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)) #possible knight moves
-            if engine.whiteTurn: #determine the color of ally
-                allyColor = "w"
-            else:
-                allyColor = "b"
-            for move in knightMoves:
-                final_row = row + move[0] 
-                final_col = col + move[1]
-                if 0 <= final_row < 8 and 0 <= final_col < 8: # if position is on the board
-                    finalPiece = engine.board[final_row][final_col] #variable that stores final position
-                    if finalPiece[0] != allyColor:
-                        moves.append(Move((row, col), (final_row, final_col), engine.board))
+            moves.append(square | target << 6)
 
-    #only difference between bishop and rook is the direction
-    def getBishopMoves(self, row, col, moves, engine): #get all rook moves for rook at position (row, col) and add these to the list
-        bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1)) #diagonals
-        if engine.whiteTurn: #determine the color of the enemy
-            enemyColor = "b"
+    def canCaptureEnPassant(self, row, col, target, targets, engine): #can the pawn at (row, col) capture en passant on target?
+        captured = row * 8 + (target & 7) #the captured pawn is next to ours, on the same row
+        #capturing the pawn that gives check is fine even though we don't land on the checking square
+        if not (targets >> target & 1 or targets >> captured & 1):
+            return False
+        """
+        En passant removes two pawns from the same row at once. If our king is on that row with an enemy rook or queen
+        behind the two pawns, the capture uncovers a check that the pin detection can't see, so we look at the board 
+        as it would be after the capture and make sure no enemy piece attacks our king.
+        """
+        if engine.whiteTurn:
+            kingRow, kingCol = engine.whiteKingPosition
+            enemy = "b"
         else:
-            enemyColor = "w"
-        for d in bishopDirections:
-            for i in range(1, 8): #rook max range
-                final_row = row + d[0] * i #starting row + its direction (up or down) * i
-                final_col = col + d[1] * i  #starting col + its direction (left or right) * i
-                if 0 <= final_row < 8 and 0 <= final_col < 8: # if position is on the board
-                    finalPiece = engine.board[final_row][final_col] #variable that stores final position
-                    if finalPiece == "  ": #if an empty space is available
-                        moves.append(Move((row, col), (final_row, final_col), engine.board))
-                    elif finalPiece[0] == enemyColor: #if an enemy piece can be captured
-                        moves.append(Move((row, col), (final_row, final_col), engine.board))
-                        break
-                    else: #friendly piece, cannot take
-                        break
-                else: #not on the board
-                    break
-
-    def getQueenMoves(self, row, col, moves, engine): #get all queen moves for queen at position (row, col) and add these to the list
+            kingRow, kingCol = engine.blackKingPosition
+            enemy = "w"
+        occupied = (engine.occupancy["w"] | engine.occupancy["b"]) ^ (1 << (row * 8 + col)) ^ (1 << captured) | (1 << target)
+        #the captured pawn is gone, so it doesn't count as an attacker
+        return not engine.attackersTo(kingRow * 8 + kingCol, enemy, occupied) & ~(1 << captured)
+
+    def getRookMoves(self, row, col, moves, engine, targets = FULL_BOARD): #get all rook moves for rook at position (row, col) and add these to the list
+        occupied = engine.occupancy["w"] | engine.occupancy["b"]
+        #one table lookup gives every square the rook attacks, up to and including the first piece on each ray
+        self.getSlidingMoves(row, col, rookAttacks(row * 8 + col, occupied) & targets, moves, engine)
+
+    def getKnightMoves(self, row, col, moves, engine, targets = FULL_BOARD): #get all knight moves for knight at position (row, col) and add these to the list       
+            targets &= ~engine.occupancy["w" if engine.whiteTurn else "b"] #squares not occupied by our own pieces
+            square = row * 8 + col
+            for target in KNIGHT_TARGETS[square]: #possible knight moves, looked up instead of recomputed
+                if targets >> target & 1: #final square doesn't hold an ally
+                    moves.append(square | target << 6)
+
+    #only difference between bishop and rook is the direction
+    def getBishopMoves(self, row, col, moves, engine, targets = FULL_BOARD): #get all bishop moves for bishop at position (row, col) and add these to the list
+        occupied = engine.occupancy["w"] | engine.occupancy["b"]
+        self.getSlidingMoves(row, col, bishopAttacks(row * 8 + col, occupied) & targets, moves, engine)
+
+    def getQueenMoves(self, row, col, moves, engine, targets = FULL_BOARD): #get all queen moves for queen at position (row, col) and add these to the list
         #a queen has the combined moves of a rook and a bishop
-        self.getRookMoves(row, col, moves, engine)
-        self.getBishopMoves(row, col, moves, engine)
+        occupied = engine.occupancy["w"] | engine.occupancy["b"]
+        self.getSlidingMoves(row, col, queenAttacks(row * 8 + col, occupied) & targets, moves, engine)
+
+    def getSlidingMoves(self, row, col, attacks, moves, engine): #add a move to every attacked square that doesn't hold an ally
+        attacks &= ~engine.occupancy["w" if engine.whiteTurn else "b"] #friendly pieces cannot be taken
+        square = row * 8 + col
+        while attacks:
+            lowestBit = attacks & -attacks
+            attacks ^= lowestBit
+            moves.append(square | (lowestBit.bit_length() - 1) << 6)
 
     #pretty similar to knight
-    def getKingMoves(self, row, col, moves, engine): #get all king moves for king at position (row, col) and add these to the list
-        kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)) #possible king moves
-        if engine.whiteTurn: #determine the color of ally
-            allyColor = "w"
-        else:
-            allyColor = "b"
-        for i in range(8):
-            final_row = row + kingMoves[i][0]
-            final_col = col + kingMoves[i][1] 
-            if 0 <= final_row < 8 and 0 <= final_col < 8: # if position is on the board
-                finalPiece = engine.board[final_row][final_col] #variable that stores final position
-                if finalPiece[0] != allyColor:
-                        moves.append(Move((row, col), (final_row, final_col), engine.board))
+    def getKingMoves(self, row, col, moves, engine, targets = FULL_BOARD): #get all king moves for king at position (row, col) and add these to the list
+        targets &= ~engine.occupancy["w" if engine.whiteTurn else "b"] #squares not occupied by our own pieces
+        square = row * 8 + col
+        for target in KING_TARGETS[square]: #possible king moves, looked up instead of recomputed
+            if targets >> target & 1: #final square doesn't hold an ally
+                moves.append(square | target << 6)
 
         """
         conditions that may prevent one from castling:
@@ -146,35 +175,50 @@ class Piece:
             moved.
         """
     
-    def getCastleMoves(self, row, col, moves, engine, chess_piece):
-        #1)
-        if (engine.whiteTurn and engine.currentCastlingRight.wks) or (not engine.whiteTurn and engine.currentCastlingRight.bks):
-            self.getKingSideCastleMoves(row, col, moves, engine, chess_piece)
-        
-        if (engine.whiteTurn and engine.currentCastlingRight.wqs) or (not engine.whiteTurn and engine.currentCastlingRight.bqs):
-            self.getQueenSideCastleMoves(row, col, moves, engine, chess_piece)
+    def getCastleMoves(self, row, col, moves, engine, attacked): #attacked = bitboard of the squares the opponent attacks
         #2)
-        if engine.squareAttacked(row, col, chess_piece, engine): 
+        if attacked >> (row * 8 + col) & 1: 
             return #we can't castle if we're in check
+        #4) + 5) are tracked by the castling rights
+        if engine.castlingRights & (WHITE_KINGSIDE if engine.whiteTurn else BLACK_KINGSIDE):
+            self.getKingSideCastleMoves(row, col, moves, engine, attacked)
+        
+        if engine.castlingRights & (WHITE_QUEENSIDE if engine.whiteTurn else BLACK_QUEENSIDE):
+            self.getQueenSideCastleMoves(row, col, moves, engine, attacked)
         
-    def getKingSideCastleMoves(self, row, col, moves, engine, chess_piece):
-        if (engine.board[row][col+1] == "  ") and (engine.board[row][col+2] == "  "): #3) check to the right
-            #if empty squares aren't attacked
-            if not engine.squareAttacked(row, col+1, chess_piece, engine) and not engine.squareAttacked(row, col+2, chess_piece, engine): 
-                moves.append(Move((row, col), (row, col+2), engine.board, isCastle=True)) #append move
-
-    def getQueenSideCastleMoves(self, row, col, moves, engine, chess_piece):
-        if engine.board[row][col-1] == "  " and engine.board[row][col-2] == "  " and engine.board[row][col-3] == "  ": #3) check to the left
-            #if the two empty squares to the left aren't attacked
-            if not engine.squareAttacked(row, col-1, chess_piece, engine) and not engine.squareAttacked(row, col-2, chess_piece, engine):
-                moves.append(Move((row, col), (row, col-2), engine.board, isCastle=True)) #append move
-
-class CastleRights:
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs =bqs
+    def getKingSideCastleMoves(self, row, col, moves, engine, attacked):
+        occupied = engine.occupancy["w"] | engine.occupancy["b"]
+        path = (1 << (row * 8 + col+1)) | (1 << (row * 8 + col+2))
+        if not occupied & path: #1) the two squares to the right are empty
+            if not attacked & path: #3) and they aren't attacked
+                moves.append(row * 8 + col | (row * 8 + col+2) << 6 | CASTLE) #append move
+
+    def getQueenSideCastleMoves(self, row, col, moves, engine, attacked):
+        occupied = engine.occupancy["w"] | engine.occupancy["b"]
+        path = (1 << (row * 8 + col-1)) | (1 << (row * 8 + col-2))
+        if not occupied & (path | (1 << (row * 8 + col-3))): #1) the three squares to the left are empty
+            if not attacked & path: #3) the two squares the king crosses aren't attacked
+                moves.append(row * 8 + col | (row * 8 + col-2) << 6 | CASTLE) #append move
+
+"""
+The four castling rights are stored as the bits of one number between 0 and 15, so they can be copied and restored 
+without creating objects. 
+"""
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING_RIGHTS = 15
+
+#the rights that survive a move from or to each square. A king or rook leaving its starting square, 
+#or a rook being captured on it, clears the matching rights
+CASTLING_MASKS = [ALL_CASTLING_RIGHTS] * 64
+CASTLING_MASKS[0] = ALL_CASTLING_RIGHTS & ~BLACK_QUEENSIDE #black's left rook
+CASTLING_MASKS[4] = ALL_CASTLING_RIGHTS & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE) #black king
+CASTLING_MASKS[7] = ALL_CASTLING_RIGHTS & ~BLACK_KINGSIDE #black's right rook
+CASTLING_MASKS[56] = ALL_CASTLING_RIGHTS & ~WHITE_QUEENSIDE #white's left rook
+CASTLING_MASKS[60] = ALL_CASTLING_RIGHTS & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE) #white king
+CASTLING_MASKS[63] = ALL_CASTLING_RIGHTS & ~WHITE_KINGSIDE #white's right rook
 
 class Move:
     #maps keys to values
@@ -187,7 +231,7 @@ class Move:
                    "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, initial_square, final_square, board, isEnPassant = False, isCastle = False):
+    def __init__(self, initial_square, final_square, board, isEnPassant = False, isCastle = False, promotionPiece = "Q"):
         self.initial_row = initial_square[0]
         self.initial_col = initial_square[1]
         self.final_row = final_square[0]
@@ -202,6 +246,7 @@ class Move:
         self.isPawnPromotion = False
         if (self.pieceMoved == "wP" and self.final_row == 0) or (self.pieceMoved == "bP" and self.final_row == 7):
             self.isPawnPromotion = True
+        self.promotionPiece = promotionPiece #"Q", "R", "B" or "N", only used if isPawnPromotion
         
         #en passant
         #we need to pass an optional parameter isEnPassant for en passant moves
@@ -216,22 +261,45 @@ class Move:
         #castle move
         self.isCastle = isCastle
 
+        #the same move packed into an integer, the way the engine stores it
+        self.packed = self.initial_row * 8 + self.initial_col | (self.final_row * 8 + self.final_col) << 6
+        if self.isPawnPromotion:
+            self.packed |= PROMOTION | PROMOTION_PIECES.index(self.promotionPiece) << 12
+        elif self.isEnPassant:
+            self.packed |= EN_PASSANT
+        elif self.isCastle:
+            self.packed |= CASTLE
+
     #overriding the built-in equals method
     def __eq__(self, other): #compares an object to another object which is saved in the parameter "other" 
         """Make sure other object is an instance of the Move class, since if we were to compare a move to a number, 
         and then say something like Move().initial_row, it won't work!""" 
         if isinstance(other, Move): 
             return self.moveID == other.moveID #check if moveID's are equal
+        if isinstance(other, int): #a packed move from the engine is equal if it goes between the same squares
+            if self.isPawnPromotion: #and, for promotions, promotes to the same piece
+                return self.packed == other
+            return self.packed & ~FLAGS == other & ~FLAGS
         return False
 
     def getChessNotation(self, engine): #gets chess notation
         piece = engine.board[self.initial_row][self.initial_col][1]
         if piece == "P":
+            if self.isPawnPromotion: #for example e8=Q
+                return self.getFileRank(self.final_row, self.final_col) + "=" + self.promotionPiece
             return self.getFileRank(self.final_row, self.final_col)
         else:
             return piece + self.getFileRank(self.final_row, self.final_col)
     
     def getFileRank(self, row, col): #convert from (row, col) notation to (file, rank) notation 
         return self.colsToFiles[col] + self.rowsToRanks[row]
+
+    @classmethod
+    def getUciNotation(cls, move): #packed move in the coordinate notation other engines use, for example e2e4 or e7e8q
+        notation = (cls.colsToFiles[move & 7] + cls.rowsToRanks[(move >> 3) & 7] 
+                    + cls.colsToFiles[(move >> 6) & 7] + cls.rowsToRanks[(move >> 9) & 7])
+        if move >= PROMOTION:
+            notation += PROMOTION_PIECES[(move >> 12) & 3].lower()
+        return notation
     
     
\ No newline at end of file
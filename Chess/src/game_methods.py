@@ -74,9 +74,9 @@ class Game:
                     screen.blit(surface, (col*engine_settings.SQSIZE, row*engine_settings.SQSIZE))
                     #highlight moves from that square
                     surface.fill(p.Color("yellow"))
-                    for move in validMoves:
-                        if move.initial_row == row and move.initial_col == col:
-                            screen.blit(surface, (move.final_col*engine_settings.SQSIZE, move.final_row*engine_settings.SQSIZE))
+                    for move in validMoves: #moves are packed integers: bits 0-5 initial square, bits 6-11 final square
+                        if move & 63 == row * 8 + col:
+                            screen.blit(surface, (((move >> 6) & 7)*engine_settings.SQSIZE, ((move >> 9) & 7)*engine_settings.SQSIZE))
        
         if engine.whiteTurn and engine.inCheck(chess_piece, engine): #highlight white king square if it is in check
             (row, col) = (engine.whiteKingPosition[0], engine.whiteKingPosition[1])
@@ -0,0 +1,273 @@
+"""
+This module counts the positions the move generator reaches (perft), to test its correctness and measure its speed.
+"""
+
+"""
+Perft ("performance test") makes every legal move to a fixed depth and counts the positions at the last ply.
+The counts for well known positions have been verified by many engines, so a wrong count means a bug in
+getValidMoves, makeMove or undo_move. "Divide" prints the count below every root move, which narrows a wrong
+count down to a single move. The time taken gives a reproducible nodes-per-second number for the move generator.
+
+Usage (from the repository root):
+    python Chess/src/perft.py 4
+    python Chess/src/perft.py 3 --moves e2e4 e7e5 --divide
+    python Chess/src/perft.py 3 --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+    python Chess/src/perft.py --verify 5
+    python Chess/src/perft.py 6 --workers 0 --divide
+    python Chess/src/perft.py 6 --cache 1048576
+"""
+
+"""
+A perft tree splits naturally into independent subtrees, one per move near the root. With more than one worker,
+the moves of the first one or two plies are enumerated here and every subtree below them is counted in its own
+process by a ProcessPoolExecutor. The workers get the position as ChessEngine.getPosition (a short tuple) plus the
+few packed moves leading to their subtree, so very little data crosses between processes. Splitting two plies deep
+gives a few hundred tasks instead of about twenty, which keeps all cores busy until the end of the run.
+"""
+
+"""
+Different move orders often reach the same position (1.e4 e5 2.Nf3 and 1.Nf3 e5 2.e4), and the subtree below it has the
+same size every time. With a cache, the count below a position is stored under its Zobrist hash and the remaining depth,
+so a transposition costs one lookup instead of a whole subtree. The cache has a fixed number of buckets, chosen by the
+low bits of the hash, with two slots each: one keeps the deepest (most expensive) subtree seen in that bucket, the
+other always takes the newest entry. The full 64-bit key is stored, so a collision of the low bits is never a hit.
+Keys that collide in all 64 bits are possible in theory but so rare that perft engines accept the risk.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chess_engine import ChessEngine
+from chess_pieces import Piece, Move
+
+#verified node counts, by depth, for positions that test the special rules: castling, en passant, promotions and pins
+KNOWN_POSITIONS = (
+    ("initial position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609, 6: 119060324}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603, 5: 193690690}),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624, 6: 11030083}),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333, 5: 15833292}),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487, 5: 89941194}),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594, 5: 164075551}),
+    )
+
+class PerftCache:
+    def __init__(self, entries): #entries is rounded down to a power of two, so a bucket is found with a mask
+        buckets = 1 << (max(entries // 2, 1).bit_length() - 1)
+        self.mask = buckets - 1
+        #slot 2 * bucket keeps the deepest entry, slot 2 * bucket + 1 the newest one. A depth of 0 marks an empty slot
+        self.keys = [0] * (buckets * 2)
+        self.depths = [0] * (buckets * 2)
+        self.counts = [0] * (buckets * 2)
+        self.probes = 0
+        self.hits = 0
+
+    def get(self, key, depth): #stored node count of the position with this key at this depth, or None
+        self.probes += 1
+        slot = (key & self.mask) << 1
+        if self.keys[slot] == key and self.depths[slot] == depth:
+            self.hits += 1
+            return self.counts[slot]
+        slot += 1
+        if self.keys[slot] == key and self.depths[slot] == depth:
+            self.hits += 1
+            return self.counts[slot]
+        return None
+
+    def store(self, key, depth, nodes):
+        slot = (key & self.mask) << 1
+        if depth < self.depths[slot]: #a deeper subtree saves more work, so it keeps its slot
+            slot += 1
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.counts[slot] = nodes
+
+class Perft:
+    def __init__(self, cacheEntries = 0): #without cacheEntries every subtree is counted in full
+        self.chess_piece = Piece()
+        self.cache = PerftCache(cacheEntries) if cacheEntries > 0 else None
+
+    def countNodes(self, engine, depth): #number of positions reached after depth plies from the current position
+        if depth == 0:
+            return 1
+        if self.cache is not None: #even at depth 1 a hit saves generating the legal moves
+            nodes = self.cache.get(engine.hash, depth)
+            if nodes is not None:
+                return nodes
+        moves = engine.getValidMoves(self.chess_piece, engine)
+        if depth == 1: #no need to make the last moves, counting them is enough
+            if self.cache is not None:
+                self.cache.store(engine.hash, 1, len(moves))
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            engine.makeMove(move)
+            nodes += self.countNodes(engine, depth - 1)
+            engine.undo_move()
+        if self.cache is not None:
+            self.cache.store(engine.hash, depth, nodes)
+        return nodes
+
+    def cacheStatistics(self): #(probes, hits) of the cache so far, (0, 0) without a cache
+        if self.cache is None:
+            return (0, 0)
+        return (self.cache.probes, self.cache.hits)
+
+    def divide(self, engine, depth): #node count below every root move, keyed by the move in coordinate notation
+        counts = {}
+        for move in engine.getValidMoves(self.chess_piece, engine):
+            engine.makeMove(move)
+            counts[Move.getUciNotation(move)] = self.countNodes(engine, depth - 1)
+            engine.undo_move()
+        return counts
+
+    def splitTree(self, engine, plies): #every sequence of plies legal moves from the current position, as tuples
+        paths = []
+        for move in engine.getValidMoves(self.chess_piece, engine):
+            if plies == 1:
+                paths.append((move,))
+            else:
+                engine.makeMove(move)
+                paths.extend((move,) + path for path in self.splitTree(engine, plies - 1))
+                engine.undo_move()
+        return paths
+
+    def parallelDivide(self, engine, depth, workers, splitDepth): #divide with the subtrees counted in worker processes
+        counts = {} #every root move starts at 0, so a move without replies still shows up when splitting two plies deep
+        for move in engine.getValidMoves(self.chess_piece, engine):
+            counts[Move.getUciNotation(move)] = 0
+        cpuSeconds = 0.0 #time spent inside the workers, added up over all subtrees
+        probes, hits = 0, 0
+        position = engine.getPosition()
+        cacheEntries = (self.cache.mask + 1) * 2 if self.cache is not None else 0 #every worker gets a cache of the same size
+        with ProcessPoolExecutor(max_workers = workers, initializer = startWorker, initargs = (cacheEntries,)) as executor:
+            futures = {executor.submit(countSubtree, position, path, depth - len(path)): path[0]
+                       for path in self.splitTree(engine, splitDepth)}
+            for future in as_completed(futures):
+                nodes, seconds, taskProbes, taskHits = future.result()
+                counts[Move.getUciNotation(futures[future])] += nodes
+                cpuSeconds += seconds
+                probes += taskProbes
+                hits += taskHits
+        return counts, cpuSeconds, probes, hits
+
+    def run(self, engine, depth, workers = 1, splitDepth = 2): #perft with divide and timing, returned as a dictionary
+        splitDepth = min(splitDepth, depth - 1) #the last ply is counted without making its moves, so never split there
+        start = time.perf_counter()
+        if workers > 1 and splitDepth > 0:
+            counts, cpuSeconds, probes, hits = self.parallelDivide(engine, depth, workers, splitDepth)
+        else:
+            workers = 1
+            (probesBefore, hitsBefore) = self.cacheStatistics()
+            counts = self.divide(engine, depth) if depth > 0 else {}
+            (probes, hits) = self.cacheStatistics()
+            probes, hits = probes - probesBefore, hits - hitsBefore
+        seconds = time.perf_counter() - start
+        if workers == 1:
+            cpuSeconds = seconds
+        nodes = sum(counts.values()) if depth > 0 else 1
+        return {
+            "depth": depth,
+            "nodes": nodes,
+            "divide": counts,
+            "seconds": seconds,
+            "nps": nodes / seconds if seconds > 0 else 0.0,
+            "workers": workers,
+            "cpuSeconds": cpuSeconds, #equal to seconds for a single process
+            "cacheProbes": probes,
+            "cacheHits": hits,
+            "hitRate": hits / probes if probes > 0 else 0.0
+            }
+
+    def playMoves(self, engine, moves): #make a list of moves given in coordinate notation, like ["e2e4", "e7e5"]
+        for notation in moves:
+            for move in engine.getValidMoves(self.chess_piece, engine):
+                if Move.getUciNotation(move) == notation.lower():
+                    engine.makeMove(move)
+                    break
+            else:
+                raise ValueError("illegal move: " + notation)
+
+    def verify(self, maxDepth, workers = 1): #compare the counts of the known positions against their verified results
+        passed = True
+        for (name, fen, results) in KNOWN_POSITIONS:
+            print(name)
+            for depth in range(1, min(maxDepth, max(results)) + 1):
+                result = self.run(ChessEngine.from_fen(fen), depth, workers)
+                expected = results[depth]
+                status = "ok" if result["nodes"] == expected else "FAILED"
+                print("    depth %d: %d nodes (expected %d) %s, %.2fs, %.0f nodes/s"
+                      % (depth, result["nodes"], expected, status, result["seconds"], result["nps"]))
+                passed = passed and result["nodes"] == expected
+        return passed
+
+workerPerft = None #the Perft of a worker process, kept between tasks so its cache is shared by all subtrees the worker counts
+
+def startWorker(cacheEntries): #runs once in every worker process
+    global workerPerft
+    workerPerft = Perft(cacheEntries)
+
+def countSubtree(position, path, depth): #worker task: nodes depth plies below the position reached by path, the time taken and the cache statistics
+    start = time.perf_counter()
+    probes, hits = workerPerft.cacheStatistics()
+    engine = ChessEngine.fromPosition(position)
+    for move in path:
+        engine.makeMove(move)
+    nodes = workerPerft.countNodes(engine, depth)
+    (totalProbes, totalHits) = workerPerft.cacheStatistics()
+    return nodes, time.perf_counter() - start, totalProbes - probes, totalHits - hits
+
+def printResult(result, showDivide): #print the result of Perft.run
+    if showDivide:
+        for notation in sorted(result["divide"]):
+            print("%s: %d" % (notation, result["divide"][notation]))
+        print()
+    print("Depth: %d" % result["depth"])
+    print("Nodes: %d" % result["nodes"])
+    print("Time: %.3fs" % result["seconds"])
+    print("Nodes/second: %.0f" % result["nps"])
+    if result["workers"] > 1:
+        #how many workers were busy on average, not a speedup: that needs a single process run to compare with
+        parallelism = result["cpuSeconds"] / result["seconds"] if result["seconds"] > 0 else 0.0
+        print("Workers: %d, CPU time: %.3fs, parallelism: %.1f" % (result["workers"], result["cpuSeconds"], parallelism))
+    if result["cacheProbes"] > 0:
+        print("Cache: %d probes, %d hits, hit rate %.1f%%"
+              % (result["cacheProbes"], result["cacheHits"], 100 * result["hitRate"]))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Count leaf nodes of the legal move tree (perft).")
+    parser.add_argument("depth", type = int, nargs = "?", default = 4, help = "number of plies to search (default 4)")
+    parser.add_argument("--fen", help = "start from this position instead of the initial one")
+    parser.add_argument("--moves", nargs = "*", default = [], help = "moves from the start position, e.g. e2e4 e7e5")
+    parser.add_argument("--divide", action = "store_true", help = "print the node count below every root move")
+    parser.add_argument("--verify", type = int, metavar = "DEPTH",
+                        help = "check the known positions against their verified counts up to DEPTH")
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "number of processes to count subtrees in, 0 for one per CPU core (default 1)")
+    parser.add_argument("--cache", type = int, default = 0, metavar = "ENTRIES",
+                        help = "cache subtree counts in a table of ENTRIES entries, per process (default 0, no cache)")
+    parser.add_argument("--split", type = int, choices = (1, 2), default = 2,
+                        help = "plies below the root at which the tree is split between workers (default 2)")
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count()
+    perft = Perft(args.cache)
+    if args.verify:
+        return 0 if perft.verify(args.verify, workers) else 1
+    try:
+        engine = ChessEngine.from_fen(args.fen) if args.fen else ChessEngine()
+        perft.playMoves(engine, args.moves)
+    except ValueError as error:
+        parser.error(str(error))
+    printResult(perft.run(engine, args.depth, workers, args.split), args.divide)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
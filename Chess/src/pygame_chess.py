@@ -28,6 +28,7 @@ class Main:
 
         self.moveMade = False
         self.gameOver = False
+        self.promotionPiece = "Q" #piece a pawn promotes to when the player moves it to the last row (Q, R, B or N keys)
 
         self.smartMove = ChessAI()
         
@@ -51,6 +52,7 @@ class Main:
 
         sqSelected = self.sqSelected
         playerClicks = self.playerClicks
+        promotionPiece = self.promotionPiece
 
         validMoves = engine.getValidMoves(chess_piece, engine)
         moveMade = self.moveMade #flag for checking if a move is made
@@ -80,7 +82,7 @@ class Main:
                             sqSelected = (clicked_row, clicked_col)
                             playerClicks.append(sqSelected) #append for both 1st and 2nd clicks
                         if len(playerClicks) == 2: #after players 2nd click, the board has to display the move
-                            move = Move(playerClicks[0], playerClicks[1], engine.board)
+                            move = Move(playerClicks[0], playerClicks[1], engine.board, promotionPiece = promotionPiece)
                             #we will be adding flags to moves, to indicate whether they are pawn promotions, en passant or castling
                             #when these flags are added, the engine needs to be able to recognize them, 
                             #or the program won't be able to either
@@ -98,10 +100,12 @@ class Main:
                     if event.key == p.K_LEFT: #undo move if left arrow key is pressed
                         engine.undo_move()
                         moveMade = True
+                    elif event.key in (p.K_q, p.K_r, p.K_b, p.K_n): #choose the piece for the next promotion
+                        promotionPiece = p.key.name(event.key).upper()
             
             #AI move finder
             if not gameOver and not humanTurn:
-                AIMove = smartMove.findGreedyMove(chess_piece, engine, validMoves)
+                AIMove = smartMove.findTimedMove(engine, engine_settings.AI_TIME_LIMIT)
                 if AIMove is None: #if it can't find best move because of checkmate
                     AIMove = smartMove.findRandomMove(validMoves) #it finds a random one
                 engine.makeMove(AIMove)
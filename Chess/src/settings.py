@@ -16,6 +16,7 @@ class Settings():
         self.SQSIZE = self.WIDTH // self.ROWS
         
         self.MAX_FPS = 15 #for animations later on
+        self.AI_TIME_LIMIT = 1000 #milliseconds the AI may think about a move
         self.IMAGES = {} #dictionary of images
 
 
@@ -0,0 +1,86 @@
+"""
+This module stores the transposition table used by the AI search.
+"""
+
+"""
+Different move orders often lead to the same position, and the search would otherwise search it again every time.
+The transposition table remembers, for every position it is given, the result of searching it: the score, whether
+that score is exact or only a bound, how deep the search went and the best move found. It is keyed by the Zobrist hash
+of the position (see zobrist.py).
+
+The table is one preallocated array of 64-bit integers with two numbers per entry: the full key, so that positions
+whose keys share the same low bits are told apart, and the data packed into one integer:
+    bits 0-15: best move (packed, see chess_pieces.py), 0 if there is none
+    bits 16-31: score + 32768
+    bits 32-39: depth
+    bits 40-41: bound (EXACT, LOWER or UPPER)
+    bits 42-49: generation (age) of the search that stored it
+Its size never changes, so a full table replaces entries instead of growing. A new entry replaces the old one in its
+slot if the old one is from an earlier search (aging), if it is for the same position, or if it was searched at most
+as deep (depth-preferred), since a deeper result saves more work the next time the position comes up.
+"""
+
+from array import array
+
+EXACT = 0 #the score is the exact score of the position
+LOWER = 1 #the search failed high: the real score is at least the stored score
+UPPER = 2 #the search failed low: the real score is at most the stored score
+
+ENTRY_BYTES = 16 #two 64-bit numbers
+
+class TranspositionTable:
+    def __init__(self, sizeMB = 16):
+        entries = 1 << (max(int(sizeMB * 1024 * 1024 // ENTRY_BYTES), 1).bit_length() - 1) #a power of two, so a mask finds the slot
+        self.mask = entries - 1
+        self.table = array("Q", [0]) * (entries * 2) #keys at even indices, data at odd indices
+        self.generation = 0
+        #statistics
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0 #stores that replaced an entry of another position
+
+    def newSearch(self): #called at the start of every search, so entries of earlier searches become replaceable
+        self.generation = (self.generation + 1) & 255
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def clear(self):
+        self.table = array("Q", [0]) * len(self.table)
+        self.generation = 0
+
+    def probe(self, key): #(move, score, depth, bound) stored for the position with this key, or None
+        self.probes += 1
+        index = (key & self.mask) << 1
+        if self.table[index] != key:
+            return None
+        data = self.table[index + 1]
+        if data == 0: #empty slot, only possible for a key of 0
+            return None
+        self.hits += 1
+        return (data & 0xFFFF, ((data >> 16) & 0xFFFF) - 32768, (data >> 32) & 0xFF, (data >> 40) & 3)
+
+    def store(self, key, move, score, depth, bound):
+        index = (key & self.mask) << 1
+        oldKey = self.table[index]
+        oldData = self.table[index + 1]
+        if oldData and oldKey != key:
+            if (oldData >> 42) & 255 == self.generation and (oldData >> 32) & 0xFF > depth:
+                return #a deeper result of this search is more valuable
+            self.overwrites += 1
+        elif oldKey == key and move == 0:
+            move = oldData & 0xFFFF #keep the best move of an earlier search of the same position
+        self.stores += 1
+        self.table[index] = key
+        self.table[index + 1] = move | (score + 32768) << 16 | depth << 32 | bound << 40 | self.generation << 42
+
+    def usage(self): #permille of the first 1000 slots filled in the current search, a sample of how full the table is
+        used = 0
+        slots = min(1000, self.mask + 1)
+        for slot in range(slots):
+            data = self.table[slot * 2 + 1]
+            if data and (data >> 42) & 255 == self.generation:
+                used += 1
+        return used * 1000 // slots
@@ -0,0 +1,26 @@
+"""
+This module stores the random numbers used for Zobrist hashing.
+"""
+
+"""
+Zobrist hashing gives every position a 64-bit key, so positions can be compared and stored in tables without looking
+at the whole board. Every (piece, square) pair, the side to move, every combination of castling rights and every
+en passant file gets a random 64-bit number. The key of a position is the XOR of the numbers of everything that is
+true in it. Because XOR undoes itself, a move only has to XOR the numbers of what it changes in or out of the key.
+"""
+
+import random
+
+from bitboards import PIECES
+
+randomNumbers = random.Random(20240101) #fixed seed, so the keys are the same every time the program runs
+
+PIECE_KEYS = {piece: [randomNumbers.getrandbits(64) for square in range(64)] for piece in PIECES}
+BLACK_TO_MOVE_KEY = randomNumbers.getrandbits(64) #included when it is black's turn
+CASTLING_KEYS = [randomNumbers.getrandbits(64) for rights in range(16)] #one key per combination of the four castling rights (see chess_pieces.py)
+EN_PASSANT_KEYS = [randomNumbers.getrandbits(64) for col in range(8)] #one key per column of the en passant square
+
+def enPassantKey(enPassantPossible): #key of the en passant square, 0 if there is none
+    if enPassantPossible == ():
+        return 0
+    return EN_PASSANT_KEYS[enPassantPossible[1]]